@@ -6,12 +6,28 @@ This file contains the Battery class
 __author__ = 'Lina Grünbeck / lina.grunbeck@gmail.com'
 
 from chargingStationSim.mesa_mod import Agent
+from chargingStationSim.vehicle import AGENT_CODES
+import numpy as np
 
 
 class Battery(Agent):
     """
     Class for a local battery pack connected to a charging station.
     """
+    __slots__ = ('station', 'resolution', 'capacity', 'max_charge', 'initial_soc', 'soc', 'upper_soc_limit',
+                 'lower_soc_limit', 'limit', 'power', 'empty', 'full')
+
+    # Label to sort agents by under visualization.
+    type = 'Battery'
+    # Code the type is reported with.
+    type_code = AGENT_CODES['Battery']
+
+    # Variables that all agents need to have so that the data collection in the Station class works.
+    arrival = None
+    break_type = None
+    break_code = -1
+    no_charge = False
+    wait_time = 0
 
     def __init__(self, unique_id, station, capacity, max_charge, soc, station_limit):
         super().__init__(unique_id, station)
@@ -30,18 +46,27 @@ class Battery(Agent):
         self.station = station
         # Time per iteration step in minutes.
         self.resolution = station.resolution
-        # Label to sort agents by under visualization.
-        self.type = 'Battery'
         # Capacity of the battery in kWh.
         self.capacity = capacity
         # The maximum charging power of the battery.
         self.max_charge = max_charge
-        # State of Charge of the vehicle battery in percentage.
-        self.soc = soc
+        # State of Charge of the battery at initialization.
+        self.initial_soc = soc
         # Upper limit for the soc of the battery.
         self.upper_soc_limit = 100
         # Lower limit for the soc of the battery.
         self.lower_soc_limit = 0
+        # The upper power limit at the station for when the battery starts discharging.
+        self.limit = station_limit
+
+        self.reset()
+
+    def reset(self):
+        """
+        Sets the battery back to its initial state of charge.
+        """
+        # State of Charge of the vehicle battery in percentage.
+        self.soc = self.initial_soc
         # How much power the battery is currently using to recharge/discharge.
         self.power = 0
         # Check if the battery is drained or fully charged at initialization.
@@ -53,14 +78,6 @@ class Battery(Agent):
             self.full = True
         else:
             self.full = False
-        # The upper power limit at the station for when the battery starts discharging.
-        self.limit = station_limit
-
-        # Variables that all agents need to have so that the data collection in the Station class works.
-        self.arrival = None
-        self.break_type = None
-        self.no_charge = False
-        self.wait_time = 0
 
     def recharge(self):
         """
@@ -103,11 +120,19 @@ class Battery(Agent):
         if self.full:
             self.full = False
 
-    def step_1(self):
+    def is_idle(self):
         """
-        Battery actions to execute for the first stage of each iteration of a simulation.
+        Checks if the battery stays at rest while no power is used at the station.
+
+        Returns
+        -------
+        True if the battery would neither recharge nor discharge.
         """
-        pass
+        if self.limit > 0:
+            return self.full
+        elif self.limit < 0:
+            return self.empty
+        return True
 
     def step_2(self):
         """
@@ -137,3 +162,73 @@ class Battery(Agent):
         else:
             self.power = 0
             self.station.batt_power = self.power
+
+
+def dispatch_battery(load, battery_params, station_limit, time_resolution):
+    """
+    Runs the battery of the Battery class against recorded station loads, for many iterations at once.
+    The battery decisions only depend on the station power without the battery and the soc of the battery, so the
+    iterations are computed side by side and only the steps are looped over.
+
+    Parameters
+    ----------
+    load: numpy array
+        Station power without the battery, with a row for each iteration and a column for each step. The power in a
+        column is the power the battery sees in that step, which is the power of the chargers after the vehicles have
+        been connected and disconnected in the step.
+    battery_params: dict
+        Parameters of the battery with capacity, max_charge and the initial soc. Each parameter is either one value
+        for all rows or an array with a value for each row.
+    station_limit: int or numpy array
+        The upper power limit at the station for when the battery starts discharging, for all rows or for each row.
+    time_resolution: int
+        Time per step in minutes.
+
+    Returns
+    -------
+    Battery power, battery soc after each step and the station power with the battery, each shaped like the load.
+    """
+    load = np.atleast_2d(np.asarray(load, dtype=float))
+    capacity = np.asarray(battery_params['capacity'], dtype=float)
+    max_charge = np.asarray(battery_params['max_charge'], dtype=float)
+    station_limit = np.asarray(station_limit, dtype=float)
+    upper_soc_limit = 100
+    lower_soc_limit = 0
+
+    power = np.zeros_like(load)
+    soc_steps = np.empty_like(load)
+    soc = np.broadcast_to(np.asarray(battery_params['soc'], dtype=float), load.shape[:1]).copy()
+    empty = soc <= lower_soc_limit
+    full = soc >= upper_soc_limit
+
+    for step in range(load.shape[1]):
+        station_power = load[:, step]
+        discharging = (station_power > station_limit) & ~empty
+        recharging = (station_power < station_limit) & ~full & ~discharging
+
+        # Discharge with the power over the limit, as in Battery.discharge.
+        discharge_power = np.minimum(station_power - station_limit, max_charge)
+        new_soc = soc - (discharge_power * (time_resolution / 60) / capacity) * 100
+        drained = new_soc < lower_soc_limit
+        reached = drained | (new_soc == lower_soc_limit)
+        discharge_power = np.where(drained, (soc - lower_soc_limit) * 0.6 * (capacity / time_resolution),
+                                   discharge_power)
+        discharge_soc = np.where(reached, lower_soc_limit, np.round(new_soc, 2))
+
+        # Recharge up to the limit, or up to half the limit while the station power is low, as in Battery.recharge.
+        recharge_power = np.minimum(np.where(station_limit / 2 < station_power, station_limit - station_power,
+                                             station_limit / 2 - station_power), max_charge)
+        new_soc = soc + (recharge_power * (time_resolution / 60) / capacity) * 100
+        overcharged = new_soc > upper_soc_limit
+        reached_full = overcharged | (new_soc == upper_soc_limit)
+        recharge_power = np.where(overcharged, (upper_soc_limit - soc) * 0.6 * (capacity / time_resolution),
+                                  recharge_power)
+        recharge_soc = np.where(reached_full, upper_soc_limit, np.round(new_soc, 2))
+
+        power[:, step] = np.where(discharging, -discharge_power, np.where(recharging, recharge_power, 0))
+        soc = np.where(discharging, discharge_soc, np.where(recharging, recharge_soc, soc))
+        empty = np.where(discharging, reached, empty & ~recharging)
+        full = np.where(recharging, reached_full, full & ~discharging)
+        soc_steps[:, step] = soc
+
+    return power, soc_steps, load + power
@@ -0,0 +1,95 @@
+# -*- encoding: utf-8 -*-
+"""
+This file contains a synthetic fleet generator for stress testing the Station class, and a benchmark of how long
+stations of growing size take to simulate one day.
+"""
+
+__author__ = 'Lina Grünbeck / lina.grunbeck@gmail.com'
+
+from chargingStationSim.station import Station
+import numpy as np
+import time
+
+
+def synthetic_fleet(num_vehicles, num_chargers, time_resolution=2, internal_share=0.5, charger_power=350,
+                    seed=1256):
+    """
+    Sets synthetic vehicle parameters and arrival and break distributions for the Station class, and makes the model
+    parameters for a station of the given size. Arrivals peak in the morning and the afternoon, and vehicles are more
+    likely to have a long break in the evening and the night.
+
+    Parameters
+    ----------
+    num_vehicles: int
+        Number of vehicles in the fleet.
+    num_chargers: int
+        Number of chargers at the station.
+    time_resolution: int
+    internal_share: float
+        Share of the fleet that are internal vehicles.
+    charger_power: int
+        Power of each charger.
+    seed: int
+        Seed for the random generator of the Station class.
+
+    Returns
+    -------
+    Dictionary with the model parameters for the Station class.
+    """
+    hours = np.arange(24)
+    # Arrivals around 8 and 16 o'clock, with some traffic at all hours.
+    arrival = 0.2 + np.exp(-0.5 * ((hours - 8) / 2) ** 2) + np.exp(-0.5 * ((hours - 16) / 2) ** 2)
+    arrival = list(arrival / arrival.sum())
+    # Share of long breaks over the day, highest at night.
+    long_share = 0.2 + 0.6 * (np.cos(2 * np.pi * hours / 24) + 1) / 2
+
+    Station.set_seed(seed=seed)
+    Station.set_params(vehicle={vehicle: {'capacity': (500, 600, 700, 800, 900),
+                                          'max_charge': (300, 350, 400, 450, 500)}
+                                for vehicle in ('External', 'Internal')},
+                       battery={'capacity': 1500, 'max_charge': 1000, 'soc': 90}, flexibility=True)
+    Station.set_arrival_dist(arrival={'Internal': arrival, 'External': arrival}, resolution=time_resolution)
+    Station.set_break_dist(short_break={'Internal': list((1 - long_share) / 2), 'External': list(1 - long_share)},
+                           medium_break={'Internal': list((1 - long_share) / 2), 'External': [0] * 24},
+                           long_break={'Internal': list(long_share), 'External': list(long_share)})
+
+    num_internal = int(num_vehicles * internal_share)
+    return {'num_external': num_vehicles - num_internal, 'num_internal': num_internal,
+            'chargers': {charger_power: num_chargers}, 'battery': False,
+            'station_limit': charger_power * num_chargers, 'time_resolution': time_resolution}
+
+
+def run_benchmark(sizes, large=True, repeat=1):
+    """
+    Simulates one day at stations of the given sizes and prints how long each took.
+
+    Parameters
+    ----------
+    sizes: list of tuple
+        Number of vehicles and number of chargers for each station.
+    large: bool
+        If the stations are simulated in large-station mode.
+    repeat: int
+        Number of days to simulate for each size. The fastest is printed.
+
+    Returns
+    -------
+    List with the fastest time in seconds for each size.
+    """
+    times = []
+    for num_vehicles, num_chargers in sizes:
+        model_params = synthetic_fleet(num_vehicles, num_chargers)
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            station = Station(large=large, **model_params)
+            station.run_model()
+            duration = time.perf_counter() - start
+            best = duration if best is None else min(best, duration)
+        times.append(best)
+        print(f'{num_vehicles:>6} vehicles {num_chargers:>4} chargers: {best:.2f} s')
+    return times
+
+
+if __name__ == '__main__':
+    run_benchmark([(100, 5), (1000, 50), (10000, 500)])
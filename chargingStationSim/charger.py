@@ -10,6 +10,7 @@ class Charger:
     """
     Class for a charger connected to a charging station.
     """
+    __slots__ = ('available', 'num_users', 'num_sockets', 'max_power', 'accessible_power', 'vehicles')
 
     def __init__(self, power, num_sockets):
         """
@@ -20,25 +21,50 @@ class Charger:
         num_sockets: int
             Number of charging sockets on the charger.
         """
-        self.available = True
-        self.num_users = 0
         self.num_sockets = num_sockets
         self.max_power = power
+        # Vehicles connected to the charger in the order they connected.
+        self.vehicles = []
+        self.reset()
+
+    def reset(self):
+        """
+        Disconnects all vehicles from the charger.
+        """
+        self.available = True
+        self.num_users = 0
         self.accessible_power = self.max_power
+        self.vehicles.clear()
 
-    def add_vehicle(self, used_power):
+    def add_vehicle(self, vehicle):
         """
         Add a new vehicle to the charger.
         """
+        self.vehicles.append(vehicle)
         self.num_users += 1
-        self.accessible_power -= used_power
+        self.accessible_power -= vehicle.power
         if self.accessible_power == 0 or self.num_users == self.num_sockets:
             self.available = False
 
-    def remove_vehicle(self, freed_power):
+    def take_power(self, power):
+        """
+        Gives more power to a vehicle that is already connected to the charger.
+        """
+        self.accessible_power -= power
+        if self.accessible_power <= 0:
+            self.available = False
+
+    def remove_vehicle(self, vehicle):
         """
-        Remove a vehicle from the charger.
+        Remove a vehicle from the charger. The freed power is offered to the vehicles still connected that
+        charge with less than their target power, in the order they connected.
         """
+        self.vehicles.remove(vehicle)
         self.num_users -= 1
-        self.accessible_power += freed_power
-        self.available = True
+        self.accessible_power += vehicle.power
+        for connected in self.vehicles:
+            if self.accessible_power <= 0:
+                break
+            if connected.power < connected.target_power:
+                connected.update_charge_power()
+        self.available = self.accessible_power > 0 and self.num_users < self.num_sockets
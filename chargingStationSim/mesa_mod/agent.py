@@ -22,6 +22,8 @@ if TYPE_CHECKING:
 class Agent:
     """Base class for a model agent."""
 
+    __slots__ = ("unique_id", "model", "pos")
+
     def __init__(self, unique_id: int, model: Model) -> None:
         """Create a new agent.
 
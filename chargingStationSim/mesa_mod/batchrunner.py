@@ -41,6 +41,10 @@ def batch_run(
     data_collection_period: int = -1,
     max_steps: int = 1000,
     display_progress: bool = True,
+    table: Optional[str] = None,
+    reuse_models: bool = True,
+    replay: Optional[List[Dict[str, Any]]] = None,
+    log: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
     """Batch run a mesa_mod model with a set of parameter values.
 
@@ -49,7 +53,8 @@ def batch_run(
     model_cls : Type[Model]
         The model class to batch-run
     parameters : Mapping[str, Union[Any, Iterable[Any]]],
-        Dictionary with model parameters over which to run the model. You can either pass single values or iterables.
+        Dictionary with model parameters to run the model with. The parameters are passed to every iteration as they
+        are, so lists and dictionaries such as a step schedule or the chargers are single values and are not swept.
     number_processes : int, optional
         Number of processes used, by default 1. Set this to None if you want to use all CPUs.
     run_id : int, optional
@@ -57,11 +62,23 @@ def batch_run(
     iterations : int, optional
         Number of iterations for each parameter combination, by default 1
     data_collection_period : int, optional
-        Number of steps after which data gets collected, by default -1 (end of episode)
+        Number of steps after which data gets collected, by default -1 (end of episode). Steps in which the
+        datacollector of the model recorded neither model nor agent variables are left out.
     max_steps : int, optional
         Maximum number of model steps after which the model halts, by default 1000
     display_progress : bool, optional
         Display batch run process, by default True
+    table : str, optional
+        Name of a datacollector table to return the rows of instead of the step data, by default None
+    reuse_models : bool, optional
+        Reset and reuse the model of the previous iteration in the same process instead of making a new one,
+        if the model class has a reset method, by default True
+    replay : List[Dict[str, Any]], optional
+        Configurations to pass to the replay method of each finished model, to return the rows it makes
+        instead of the step data, by default None
+    log : str, optional
+        Name of a datacollector table with an event log, to return the rows of after the step data of each run,
+        by default None
 
     Returns
     -------
@@ -78,8 +95,13 @@ def batch_run(
         model_cls,
         max_steps=max_steps,
         data_collection_period=data_collection_period,
+        table=table,
+        reuse_models=reuse_models,
+        replay=replay,
+        log=log,
     )
 
+    _last_model.clear()
     results: List[Dict[str, Any]] = []
 
     with tqdm(total=len(runs_list), disable=not display_progress) as pbar:
@@ -94,9 +116,47 @@ def batch_run(
                     results.extend(data)
                     pbar.update()
 
+    _last_model.clear()
     return results
 
 
+# The model that was run last in this process, with its class and parameters.
+_last_model: Dict[str, Any] = {}
+
+
+def _get_model(
+    model_cls: Type[Model],
+    kwargs: Dict[str, Any],
+    reuse_models: bool,
+) -> Model:
+    """Reset the model that was run last in this process if it has the same class and parameters,
+    otherwise make a new model.
+
+    Parameters
+    ----------
+    model_cls : Type[Model]
+        The model class to batch-run
+    kwargs : Dict[str, Any]
+        Parameters for the model
+    reuse_models : bool
+        If models that have a reset method should be reused
+
+    Returns
+    -------
+    Model
+        Model ready to be run
+    """
+    if not reuse_models or not hasattr(model_cls, "reset"):
+        return model_cls(**kwargs)
+    if _last_model.get("model_cls") is model_cls and _last_model.get("kwargs") == kwargs:
+        model = _last_model["model"]
+        model.reset()
+    else:
+        model = model_cls(**kwargs)
+        _last_model.update(model_cls=model_cls, kwargs=kwargs, model=model)
+    return model
+
+
 def _make_model_kwargs(
     parameters: Mapping[str, Union[Any, Iterable[Any]]]
 ) -> List[Dict[str, Any]]:
@@ -133,6 +193,10 @@ def _model_run_func(
     run: Tuple[int, int, Dict[str, Any]],
     max_steps: int,
     data_collection_period: int,
+    table: Optional[str] = None,
+    reuse_models: bool = False,
+    replay: Optional[List[Dict[str, Any]]] = None,
+    log: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
     """Run a single model run and collect model and agent data.
 
@@ -146,6 +210,14 @@ def _model_run_func(
         Maximum number of model steps after which the model halts, by default 1000
     data_collection_period : int
         Number of steps after which data gets collected
+    table : str, optional
+        Name of a datacollector table to return the rows of instead of the step data
+    reuse_models : bool
+        If the model of the previous run in this process should be reset and reused
+    replay : List[Dict[str, Any]], optional
+        Configurations to replay the finished model with, to return the rows of instead of the step data
+    log : str, optional
+        Name of a datacollector table with an event log, to return the rows of after the step data
 
     Returns
     -------
@@ -153,18 +225,37 @@ def _model_run_func(
         Return model_data, agent_data from the reporters
     """
     run_id, iteration, kwargs = run
-    model = model_cls(**kwargs)
+    model = _get_model(model_cls, kwargs, reuse_models)
     while model.running and model.schedule.steps <= max_steps:
         model.step()
 
+    if replay is not None:
+        return [
+            {
+                "RunId": run_id,
+                "iteration": iteration,
+                **kwargs,
+                **row,
+            }
+            for row in model.replay(replay)
+        ]
+
+    if table is not None:
+        return _table_rows(model, table, run_id, iteration, kwargs)
+
     data = []
 
-    steps = list(range(0, model.schedule.steps, data_collection_period))
-    if not steps or steps[-1] != model.schedule.steps - 1:
-        steps.append(model.schedule.steps - 1)
+    # Models that skip idle steps can run past max_steps in one step.
+    last_step = min(model.schedule.steps, max_steps + 1)
+    steps = list(range(0, last_step, data_collection_period))
+    if not steps or steps[-1] != last_step - 1:
+        steps.append(last_step - 1)
 
     for step in steps:
         model_data, all_agents_data = _collect_data(model, step)
+        # Steps the datacollector recorded nothing in are left out.
+        if not all_agents_data and not model.datacollector.is_model_step(step):
+            continue
 
         # If there are agent_reporters, then create an entry for each agent
         if all_agents_data:
@@ -192,9 +283,31 @@ def _model_run_func(
             ]
         data.extend(stepdata)
 
+    if log is not None:
+        data.extend(_table_rows(model, log, run_id, iteration, kwargs))
     return data
 
 
+def _table_rows(
+    model: Model,
+    table: str,
+    run_id: int,
+    iteration: int,
+    kwargs: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    """Make a row with the run id, iteration number and kwargs for each row of a datacollector table."""
+    columns = model.datacollector.tables[table]
+    return [
+        {
+            "RunId": run_id,
+            "iteration": iteration,
+            **kwargs,
+            **dict(zip(columns, row)),
+        }
+        for row in zip(*columns.values())
+    ]
+
+
 def _collect_data(
     model: Model,
     step: int,
@@ -202,7 +315,12 @@ def _collect_data(
     """Collect model and agent data from a model using mesas datacollector."""
     dc = model.datacollector
 
-    model_data = {param: values[step] for param, values in dc.model_vars.items()}
+    # The model variables hold one value for every model period.
+    if dc.is_model_step(step):
+        position = step // dc.model_period
+        model_data = {param: values[position] for param, values in dc.model_vars.items()}
+    else:
+        model_data = {}
 
     all_agents_data = []
     raw_agent_data = dc._agent_records.get(step, [])
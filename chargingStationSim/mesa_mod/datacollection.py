@@ -25,7 +25,12 @@ The DataCollector then stores the data it collects in dictionaries:
     * tables maps each table to a dictionary, with each column as a key with a
       list as its value.
     * _agent_records maps each model step to a list of each agents id
-      and its values.
+      and its values. Steps that repeat an earlier step share its list, and
+      agents that did not change since an earlier step keep its records.
+
+The model-level and agent-level variables can be collected at their own
+periods, so that steps that are not needed are never recorded. The model
+variables then hold one value for every period, starting with step 0.
 
 Finally, DataCollector can create a pandas DataFrame from each collection.
 
@@ -39,6 +44,7 @@ import types
 from functools import partial
 from operator import attrgetter
 
+import numpy as np
 import pandas as pd
 
 
@@ -52,7 +58,8 @@ class DataCollector:
     one and stores the results.
     """
 
-    def __init__(self, model_reporters=None, agent_reporters=None, tables=None):
+    def __init__(self, model_reporters=None, agent_reporters=None, tables=None, agents=None, codes=None,
+                 model_period=1, agent_period=1, agent_last=None):
         """Instantiate a DataCollector with lists of model and agent reporters.
         Both model_reporters and agent_reporters accept a dictionary mapping a
         variable name to either an attribute name, or a method.
@@ -75,6 +82,22 @@ class DataCollector:
             model_reporters: Dictionary of reporter names and attributes/funcs
             agent_reporters: Dictionary of reporter names and attributes/funcs.
             tables: Dictionary of table names to lists of column names.
+            agents: Function that returns the agents to collect agent-level
+                    variables from when given a model instance. By default
+                    the agents in the model schedule are used.
+            codes: Dictionary of agent reporter names to tuples of labels,
+                   for reporters that collect integer codes instead of
+                   labels. A code is the position of its label, and -1 is
+                   a missing value. The codes are kept as they are in the
+                   collected records, and become categoricals with the
+                   labels in the agent DataFrame.
+            model_period: Number of steps between the steps the model-level
+                          variables are collected in, starting with step 0.
+            agent_period: Number of steps between the steps the agent-level
+                          variables are collected in, starting with step 0.
+                          If None, they are only collected in agent_last.
+            agent_last: Last step of a model run, in which the agent-level
+                        variables are always collected.
 
         Notes:
             If you want to pickle your model you must not use lambda functions.
@@ -98,6 +121,22 @@ class DataCollector:
         self.model_vars = {}
         self._agent_records = {}
         self.tables = {}
+        self.agents = agents
+        self.codes = codes if codes is not None else {}
+        self.model_period = model_period
+        self.agent_period = agent_period
+        self.agent_last = agent_last
+        # Number of steps that were collected or filled so far.
+        self._steps = 0
+        # Model-level variables of the last step the model was collected in,
+        # whether they were recorded or not.
+        self._model_last = None
+        # Agent records of the last step the model was collected in, or None
+        # if they were not taken from the model.
+        self._agents_last = None
+        # Agent records of the last step the agents were read in, which are
+        # repeated for the agents that did not change since.
+        self._agents_read = None
 
         if model_reporters is not None:
             for name, reporter in model_reporters.items():
@@ -146,44 +185,191 @@ class DataCollector:
         new_table = {column: [] for column in table_columns}
         self.tables[table_name] = new_table
 
-    def _record_agents(self, model):
-        """Record agents data in a mapping of functions and agents."""
+    def _record_agents(self, model, agents=None):
+        """Record agents data in a mapping of functions and agents.
+
+        Args:
+            model: The model the agents are in.
+            agents: The agents to record. If None, all agents are recorded.
+        """
         rep_funcs = self.agent_reporters.values()
+        step = model.schedule.steps
         if all(hasattr(rep, "attribute_name") for rep in rep_funcs):
-            prefix = ["model.schedule.steps", "unique_id"]
             attributes = [func.attribute_name for func in rep_funcs]
-            get_reports = attrgetter(*prefix + attributes)
+            get_attributes = attrgetter("unique_id", *attributes)
+
+            def get_reports(agent):
+                return (step, *get_attributes(agent))
+
         else:
 
             def get_reports(agent):
-                _prefix = (agent.model.schedule.steps, agent.unique_id)
+                _prefix = (step, agent.unique_id)
                 reports = tuple(rep(agent) for rep in rep_funcs)
                 return _prefix + reports
 
-        agent_records = map(get_reports, model.schedule.agents)
+        if agents is None:
+            agents = self.agents(model) if self.agents is not None else model.schedule.agents
+        agent_records = map(get_reports, agents)
         return agent_records
 
-    def collect(self, model):
-        """Collect all the data for the given model object."""
+    def _model_values(self, model):
+        """Get the value of each model-level variable from the model."""
+        values = {}
+        for var, reporter in self.model_reporters.items():
+            # Check if Lambda operator
+            if isinstance(reporter, types.LambdaType):
+                values[var] = reporter(model)
+            # Check if model attribute
+            elif isinstance(reporter, str):
+                values[var] = getattr(model, reporter, None)
+            # Check if function with arguments
+            elif isinstance(reporter, list):
+                values[var] = reporter[0](*reporter[1])
+            # TODO: Check if method of a class, as of now it is assumed
+            # implicitly if the other checks fail.
+            else:
+                values[var] = reporter()
+        return values
+
+    def is_model_step(self, step):
+        """Check if the model-level variables are collected in a step."""
+        return step % self.model_period == 0
+
+    def is_agent_step(self, step):
+        """Check if the agent-level variables are collected in a step."""
+        if step == self.agent_last:
+            return True
+        return self.agent_period is not None and step % self.agent_period == 0
+
+    def agent_steps(self, start, end):
+        """Get the steps the agent-level variables are collected in.
+
+        Args:
+            start: First step to look at.
+            end: Step after the last step to look at.
+        """
+        steps = []
+        if self.agent_period is not None:
+            steps = list(range(start + -start % self.agent_period, end, self.agent_period))
+        last = self.agent_last
+        if last is not None and start <= last < end and (self.agent_period is None or last % self.agent_period):
+            steps.append(last)
+        return steps
+
+    def collect(self, model, hold=False, changed=None):
+        """Collect all the data for the given model object. The variables
+        are only recorded if they are due in the current step.
+
+        Args:
+            model: The model to collect the data from.
+            hold: If the data of this step is held in following steps that
+                  are filled, so that the agent-level variables are taken
+                  from the model even if they are not due.
+            changed: A dictionary of the form {position: agent...} with the
+                     agents that may have changed since the agent-level
+                     variables were last taken from the model, by their
+                     position in the collected agents. The records of the
+                     other agents are repeated. If None, all agents are read.
+        """
+        step = model.schedule.steps
+        self._steps = step + 1
         if self.model_reporters:
-            for var, reporter in self.model_reporters.items():
-                # Check if Lambda operator
-                if isinstance(reporter, types.LambdaType):
-                    self.model_vars[var].append(reporter(model))
-                # Check if model attribute
-                elif isinstance(reporter, str):
-                    self.model_vars[var].append(getattr(model, reporter, None))
-                # Check if function with arguments
-                elif isinstance(reporter, list):
-                    self.model_vars[var].append(reporter[0](*reporter[1]))
-                # TODO: Check if method of a class, as of now it is assumed
-                # implicitly if the other checks fail.
+            # The model variables are cheap, and are kept for filling the
+            # following steps even if they are not due.
+            self._model_last = self._model_values(model)
+            if self.is_model_step(step):
+                for var, value in self._model_last.items():
+                    self.model_vars[var].append(value)
+
+        if self.agent_reporters:
+            due = self.is_agent_step(step)
+            if due or hold:
+                if changed is None or self._agents_read is None:
+                    records = list(self._record_agents(model))
+                else:
+                    # The repeated records keep the step they were read in,
+                    # which is set when a DataFrame is made.
+                    records = list(self._agents_read)
+                    for position, record in zip(changed, self._record_agents(model, changed.values())):
+                        records[position] = record
+                self._agents_read = records
+                self._agents_last = records
+            else:
+                self._agents_last = None
+            if due:
+                self._agent_records[step] = self._agents_last
+
+    def fill(self, model, num_steps, model_vars=None):
+        """Repeat the data of the last step with data for the following
+        steps, for models that skip steps in which nothing changes or that
+        hold their data between the steps they collect. Only the steps the
+        variables are due in are filled. If the agent-level variables of the
+        last step the model was collected in were not recorded, they are
+        taken from the model once and repeated.
+
+        Args:
+            model: The model the data was collected from.
+            num_steps: Number of steps after the last one to fill.
+            model_vars: A dictionary of the form {reporter_name: values...}
+                        with a value for each filled step, for model
+                        variables that change anyway, like a clock.
+        """
+        if num_steps <= 0:
+            return
+        start = self._steps
+        end = start + num_steps
+        self._steps = end
+        model_vars = model_vars or {}
+        # Position of the first filled step the model variables are due in.
+        first = -start % self.model_period
+        if self.model_reporters and first < num_steps:
+            count = len(range(first, num_steps, self.model_period))
+            for var, values in self.model_vars.items():
+                if var in model_vars:
+                    values.extend(model_vars[var][first::self.model_period])
                 else:
-                    self.model_vars[var].append(reporter())
+                    values.extend([self._model_last[var]] * count)
 
         if self.agent_reporters:
-            agent_records = self._record_agents(model)
-            self._agent_records[model.schedule.steps] = list(agent_records)
+            steps = self.agent_steps(start, end)
+            if steps:
+                if self._agents_last is None:
+                    self._agents_last = list(self._record_agents(model))
+                records = self._agents_last
+                # The list is shared, the steps are set when a DataFrame is made.
+                for next_step in steps:
+                    self._agent_records[next_step] = records
+
+    def add_model_vars(self, values):
+        """Add model-level variables for steps that were computed without
+        collecting them from the model. Only the steps the variables are due
+        in are kept.
+
+        Args:
+            values: A dictionary of the form {reporter_name: values...} with
+                    a value for each step after the ones already collected.
+        """
+        first = -self._steps % self.model_period
+        num_steps = 0
+        for var, var_values in values.items():
+            self.model_vars[var].extend(var_values[first::self.model_period])
+            num_steps = len(var_values)
+        self._steps += num_steps
+
+    def clear(self):
+        """Remove all collected data while keeping the reporters and tables,
+        so that the DataCollector can be reused for a new run."""
+        for values in self.model_vars.values():
+            values.clear()
+        self._agent_records.clear()
+        self._steps = 0
+        self._model_last = None
+        self._agents_last = None
+        self._agents_read = None
+        for table in self.tables.values():
+            for values in table.values():
+                values.clear()
 
     def add_table_row(self, table_name, row, ignore_missing=False):
         """Add a row dictionary to a specific table.
@@ -214,7 +400,7 @@ class DataCollector:
         """Create a pandas DataFrame from the model variables.
 
         The DataFrame has one column for each model variable, and the index is
-        (implicitly) the model tick.
+        the model tick of each collected step.
         """
         # Check if self.model_reporters dictionary is empty, if so raise warning
         if not self.model_reporters:
@@ -222,7 +408,8 @@ class DataCollector:
                 "No model reporters have been defined in the DataCollector, returning empty DataFrame."
             )
 
-        return pd.DataFrame(self.model_vars)
+        num_steps = len(next(iter(self.model_vars.values())))
+        return pd.DataFrame(self.model_vars, index=range(0, num_steps * self.model_period, self.model_period))
 
     def get_agent_vars_dataframe(self):
         """Create a pandas DataFrame from the agent variables.
@@ -244,6 +431,18 @@ class DataCollector:
             columns=["Step", "AgentID", *rep_names],
             index=["Step", "AgentID"],
         )
+        if self._agent_records:
+            # Records can be shared with or repeated from earlier steps, so
+            # the step is taken from the step they are recorded for.
+            steps = np.repeat(
+                np.array(list(self._agent_records), dtype=int),
+                [len(records) for records in self._agent_records.values()],
+            )
+            df.index = pd.MultiIndex.from_arrays(
+                [steps, df.index.get_level_values("AgentID")], names=["Step", "AgentID"]
+            )
+        for name, labels in self.codes.items():
+            df[name] = pd.Categorical.from_codes(df[name], categories=labels)
         return df
 
     def get_table_dataframe(self, table_name):
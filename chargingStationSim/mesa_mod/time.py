@@ -76,6 +76,23 @@ class BaseScheduler:
         """
         del self._agents[agent.unique_id]
 
+    def clear(self) -> None:
+        """Remove all agents from the schedule and set the step count and
+        time back to zero, so that the schedule can be reused."""
+        self._agents.clear()
+        self.steps = 0
+        self.time = 0
+
+    def advance(self, steps: int) -> None:
+        """Move the step count and time forward without activating any
+        agents, for models that know nothing happens in these steps.
+
+        Args:
+            steps: Number of steps to skip.
+        """
+        self.steps += steps
+        self.time += steps
+
     def step(self) -> None:
         """Execute the step of all the agents, one at a time."""
         for agent in self.agent_buffer(shuffled=False):
@@ -169,22 +186,27 @@ class StagedActivation(BaseScheduler):
         stage_list: list[str] | None = None,
         shuffle: bool = False,
         shuffle_between_stages: bool = False,
+        sort_agents: bool = False,
     ) -> None:
         """Create an empty Staged Activation schedule.
 
         Args:
             model: Model object associated with the schedule.
             stage_list: List of strings of names of stages to run, in the
-                         order to run them in.
+                         order to run them in. Stages starting with
+                         'model.' are run once on the model instead.
             shuffle: If True, shuffle the order of agents each step.
             shuffle_between_stages: If True, shuffle the agents after each
                                     stage; otherwise, only shuffle at the start
                                     of each step.
+            sort_agents: If True, activate the agents in order of their
+                         unique_id instead of the order they were added in.
         """
         super().__init__(model)
         self.stage_list = stage_list if stage_list else ["step"]
         self.shuffle = shuffle
         self.shuffle_between_stages = shuffle_between_stages
+        self.sort_agents = sort_agents
         self.stage_time = 1 / len(self.stage_list)
 
     def step(self) -> None:
@@ -192,15 +214,22 @@ class StagedActivation(BaseScheduler):
         # To be able to remove and/or add agents during stepping
         # it's necessary to cast the keys view to a list.
         agent_keys = list(self._agents.keys())
+        if self.sort_agents:
+            agent_keys.sort()
         if self.shuffle:
             self.model.random.shuffle(agent_keys)
         for stage in self.stage_list:
-            for agent_key in agent_keys:
-                if agent_key in self._agents:
-                    getattr(self._agents[agent_key], stage)()  # Run stage
+            if stage.startswith("model."):
+                getattr(self.model, stage[6:])()  # Run model stage
+            else:
+                for agent_key in agent_keys:
+                    if agent_key in self._agents:
+                        getattr(self._agents[agent_key], stage)()  # Run stage
             # We recompute the keys because some agents might have been removed
             # in the previous loop.
             agent_keys = list(self._agents.keys())
+            if self.sort_agents:
+                agent_keys.sort()
             if self.shuffle_between_stages:
                 self.model.random.shuffle(agent_keys)
             self.time += self.stage_time
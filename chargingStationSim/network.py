@@ -0,0 +1,242 @@
+# -*- encoding: utf-8 -*-
+"""
+This file contains the Network class for simulating many charging stations together, and the Grid class for their
+shared grid connection.
+"""
+
+__author__ = 'Lina Grünbeck / lina.grunbeck@gmail.com'
+
+from chargingStationSim.station import Station
+from chargingStationSim.mesa_mod.model import Model
+from chargingStationSim.mesa_mod.time import BaseScheduler
+from chargingStationSim.mesa_mod.datacollection import DataCollector
+import pandas as pd
+from numpy.random import default_rng
+
+
+class Grid:
+    """
+    Class for a grid connection shared by the stations in a network, that limits their total charging power.
+    """
+    __slots__ = ('limit', 'power', 'stations')
+
+    def __init__(self, limit):
+        """
+        Parameters
+        ----------
+        limit: int
+            Upper limit for the total charging power of the stations.
+        """
+        self.limit = limit
+        # Total power the vehicles at all stations are charging with.
+        self.power = 0
+        # Stations behind the grid connection.
+        self.stations = []
+
+    @property
+    def headroom(self):
+        """
+        The power that is left on the grid connection.
+        """
+        return self.limit - self.power
+
+    def reset(self):
+        """
+        Frees all power on the grid connection.
+        """
+        self.power = 0
+
+    def take(self, power):
+        """
+        Takes power from the grid connection for a vehicle that is charging.
+        """
+        self.power += power
+
+    def free(self, power):
+        """
+        Gives back the power of a vehicle that disconnected, and lets the waiting vehicles at every station try to
+        find a charger again.
+        """
+        self.power -= power
+        for station in self.stations:
+            station.capacity_freed = True
+
+    def share(self):
+        """
+        Offers the power that is left on the grid connection to the vehicles at every station that charge with less
+        than their target power, in the order of the stations, their chargers and the vehicles on each charger.
+        Called after a vehicle disconnected and its charger offered the freed power to its own vehicles.
+        """
+        for station in self.stations:
+            for charger in station.charge_list:
+                for connected in charger.vehicles:
+                    if self.headroom <= 0:
+                        return
+                    if connected.power < connected.target_power:
+                        connected.update_charge_power()
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class Network(Model):
+    """
+    Class for a network of charging stations that are simulated together in one model. Each station has its own
+    fleet, chargers, battery and station limit, while the arrival and break distributions set for the Station class
+    are shared by all of them.
+    """
+
+    def __init__(self, sites, time_resolution, days=1, grid_limit=None, queue='fifo'):
+        """
+        Parameters
+        ----------
+        sites: list of dict
+            Parameters for each station, with num_external, num_internal, chargers, battery and station_limit, and
+            optionally vehicle_params and battery_params, as for the Station class.
+        time_resolution: int
+        days: int
+        grid_limit: int
+            Upper limit for the total charging power of all stations. If None, the stations are not connected by a
+            shared grid connection.
+        queue: str
+            Order in which waiting vehicles get a charger at every station.
+        """
+        super().__init__()
+
+        if not sites:
+            raise ValueError('The network needs at least one station.')
+
+        # Scheduler that holds the stations and keeps the time of the network.
+        self.schedule = BaseScheduler(self)
+        # Variable to stop simulation if set to False.
+        self.running = True
+        # Number of days in a simulation.
+        self.days = days
+        # Time that passes for each step in minutes.
+        self.resolution = time_resolution
+        # Shared grid connection of the stations.
+        self.grid = Grid(grid_limit) if grid_limit is not None else None
+
+        # List to contain all stations in the network.
+        self.stations = []
+        for number, site in enumerate(sites):
+            station = Station(time_resolution=time_resolution, days=days, queue=queue, **site)
+            # Number of the station in the network.
+            station.unique_id = number
+            if self.grid is not None:
+                station.grid = self.grid
+                self.grid.stations.append(station)
+            self.stations.append(station)
+            self.schedule.add(station)
+
+        if self.days == 1 and any(station.datacollector.model_period != 1 for station in self.stations):
+            raise ValueError('The stations in a network must collect their power in every step.')
+        if self.grid is not None and any(station.collect_steps is not None for station in self.stations):
+            # A station with a step schedule skips to its own next event, and would miss the power freed on the grid
+            # connection by the other stations in between.
+            raise ValueError('The stations behind a grid connection can not use a step schedule.')
+
+        if self.days > 1:
+            # Days of all stations in one table.
+            self.datacollector = DataCollector(
+                tables={'Days': ['Station'] + list(self.stations[0].datacollector.tables['Days'])})
+        else:
+            # Total power of all stations, and the power of each station in one table. Both are filled from the data
+            # collected at the stations when the simulation ends.
+            self.datacollector = DataCollector(
+                model_reporters={'GridPower': 'grid_power'},
+                tables={'Stations': ['Station', 'Step', 'Time', 'Power', 'Batt_power']})
+
+    def reset(self, seed=None):
+        """
+        Sets every station back to its initial state with a new fleet, so that the network can be simulated again.
+
+        Parameters
+        ----------
+        seed: int
+            Seed for a new random generator shared by the stations. If None, the current random generator is used.
+        """
+        if seed is not None:
+            rand_generator = default_rng(seed=seed)
+            for station in self.stations:
+                station.rand_generator = rand_generator
+        if self.grid is not None:
+            self.grid.reset()
+        for station in self.stations:
+            station.reset()
+        self.schedule.steps = 0
+        self.schedule.time = 0
+        self.datacollector.clear()
+        self.running = True
+
+    def collect_stations(self):
+        """
+        Gathers the data collected at each station into the data collector of the network.
+        """
+        if self.days > 1:
+            table = self.datacollector.tables['Days']
+            for station in self.stations:
+                days = station.datacollector.tables['Days']
+                table['Station'].extend([station.unique_id] * len(days['Day']))
+                for column, values in days.items():
+                    table[column].extend(values)
+            return
+
+        table = self.datacollector.tables['Stations']
+        grid_power = None
+        for station in self.stations:
+            model_vars = station.datacollector.model_vars
+            steps = len(model_vars['Power'])
+            table['Station'].extend([station.unique_id] * steps)
+            table['Step'].extend(range(steps))
+            for column in ('Time', 'Power', 'Batt_power'):
+                table[column].extend(model_vars[column])
+            if grid_power is None:
+                grid_power = list(model_vars['Power'])
+            else:
+                grid_power = [total + power for total, power in zip(grid_power, model_vars['Power'])]
+        self.datacollector.add_model_vars({'GridPower': grid_power})
+
+    def get_station_data(self, data='model'):
+        """
+        Combines the data collected at every station into one data frame, with the number of the station as the first
+        level of the index.
+
+        Parameters
+        ----------
+        data: str
+            'model' for the station variables, 'agents' for the vehicle variables, or the name of a table.
+
+        Returns
+        -------
+        Data frame with the data of all stations.
+        """
+        frames = {}
+        for station in self.stations:
+            if data == 'model':
+                frames[station.unique_id] = station.datacollector.get_model_vars_dataframe()
+            elif data == 'agents':
+                frames[station.unique_id] = station.datacollector.get_agent_vars_dataframe()
+            else:
+                frames[station.unique_id] = station.datacollector.get_table_dataframe(data)
+        return pd.concat(frames, names=['Station'])
+
+    def step(self):
+        """
+        Actions to execute for each iteration of a simulation. Stations that skipped ahead because nothing happened
+        at them are left until the network catches up.
+        """
+        running = [station for station in self.stations if station.running]
+        if running:
+            step = min(station.schedule.steps for station in running)
+            self.schedule.advance(step - self.schedule.steps)
+            for station in running:
+                if station.schedule.steps == step:
+                    station.step()
+        if not any(station.running for station in self.stations):
+            self.schedule.advance(max(station.schedule.steps for station in self.stations) - self.schedule.steps)
+            self.running = False
+            self.collect_stations()
+
+
+if __name__ == '__main__':
+    pass
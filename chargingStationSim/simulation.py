@@ -19,15 +19,37 @@ save_path = 'C:/Users/linag/OneDrive - Norwegian University of Life Sciences/Mas
 seed = 1256
 # Time resolution for each time step in the simulation in minutes.
 time_resolution = 2
+# Number of days to simulate. With more than one day only daily aggregates are saved.
+days = 1
+# Large-station mode, where the vehicle data is only saved for the last step of each iteration.
+large = False
+# Steps at which data is saved, as 'arrivals' for a fine resolution in busy hours and a coarse one in quiet hours, or
+# as a list of step lengths in minutes that cover one day. The other steps repeat the last saved values. If None, data
+# is saved for every step. The schedule is passed to every run as it is, like the chargers.
+step_schedule = None
+# Minutes between the steps at which the station data and the vehicle data are saved, such as the station power every
+# step with model_period = None and the vehicle soc every half hour with agent_period = 30. If None, the data is saved
+# for every step.
+model_period = None
+agent_period = None
+# Save the events in the visit of each vehicle, such as its arrival, getting a charger, power changes and leaving,
+# instead of the vehicle data of every step. The vehicle data of every step is rebuilt from the events when the
+# results are read in visualization.py.
+event_log = False
 # For how many iterations the simulation should be repeated.
 num_iter = 100
 # If there should be a stationary battery at the station.
 flexibility = False
+# Battery configurations to run against the power of each simulated fleet instead of saving the step data, such as
+# [{'capacity': 1000}, {'capacity': 2000, 'station_limit': 1200}]. Missing values are taken from the parameters below.
+battery_replay = None
 # ID number of the run with the specific parameter combination. Should start at 0.
 run_id = 0
 # Set model parameters for a simulation.
 model_params = {'num_external': 32, 'num_internal': 68, 'chargers': {350: 5, 1000: 0},
-                'battery': flexibility, 'station_limit': 1500, 'time_resolution': time_resolution}
+                'battery': flexibility, 'station_limit': 1500, 'time_resolution': time_resolution,
+                'days': days, 'large': large, 'step_schedule': step_schedule, 'model_period': model_period,
+                'agent_period': agent_period, 'event_log': event_log}
 
 # Parameters for each vehicle group containing arrays to randomly select params from.
 vehicle_params = {'External': {'capacity': (500, 600, 700, 800, 900), 'max_charge': (300, 350, 400, 450, 500)},
@@ -64,12 +86,13 @@ long_break = {'Internal': [0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00,
 # Set the seed for the random generator of the simulation.
 Station.set_seed(seed=seed)
 # Set the parameters for the simulation globally for the Station class.
-Station.set_params(vehicle=vehicle_params, battery=battery_params, flexibility=flexibility)
+Station.set_params(vehicle=vehicle_params, battery=battery_params,
+                   flexibility=flexibility or battery_replay is not None)
 Station.set_arrival_dist(arrival=arrival_dist, resolution=time_resolution)
 Station.set_break_dist(short_break=short_break, medium_break=medium_break, long_break=long_break)
 
 # Number of steps the simulation requires in one iteration.
-num_steps = int((24 / time_resolution) * 60) - 1
+num_steps = int(days * (24 / time_resolution) * 60) - 1
 
 # Start a simulation.
 results = batch_run(
@@ -81,14 +104,24 @@ results = batch_run(
     number_processes=1,
     data_collection_period=1,
     display_progress=True,
+    table='Days' if days > 1 else None,
+    replay=battery_replay,
+    log='Events' if event_log else None,
 )
 
 data = pd.DataFrame(results)
+# Steps where only the station data is saved leave the vehicle columns empty, so they are kept as integers with gaps.
+gap_columns = data.columns.intersection(['AgentID', 'Type', 'BreakType', 'Waiting', 'Event'])
+data[gap_columns] = data[gap_columns].astype('Int64')
 
+file_name = f'/simulation_{run_id}'
+if days > 1:
+    file_name += '_days'
 if flexibility:
-    data.to_csv(save_path + f'/simulation_{run_id}_flex.csv', index=False)
-else:
-    data.to_csv(save_path + f'/simulation_{run_id}.csv', index=False)
+    file_name += '_flex'
+if battery_replay is not None:
+    file_name += '_replay'
+data.to_csv(save_path + file_name + '.csv', index=False)
 
 # record end time
 end = time.time()
@@ -5,12 +5,18 @@ This file contains the Station class.
 
 __author__ = 'Lina Grünbeck / lina.grunbeck@gmail.com'
 
-from chargingStationSim.battery import Battery
+from chargingStationSim.battery import Battery, dispatch_battery
 from chargingStationSim.charger import Charger
-from chargingStationSim.vehicle import External, Internal
+from chargingStationSim.vehicle import (External, Internal, Vehicle, VehicleRecord, CHARGING, WAITING, AGENT_TYPES,
+                                        BREAK_TYPES, EVENT_CODES)
 from chargingStationSim.mesa_mod.model import Model
 from chargingStationSim.mesa_mod.time import StagedActivation
 from chargingStationSim.mesa_mod.datacollection import DataCollector
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+import heapq
+import math
+from operator import attrgetter
 import pandas as pd
 import numpy as np
 from numpy.random import default_rng
@@ -22,6 +28,9 @@ class Station(Model):
     """
     rand_generator = default_rng(seed=1256)
 
+    # Agent class for each vehicle group.
+    vehicle_classes = {'Internal': Internal, 'External': External}
+
     # Parameters for each vehicle group containing arrays to randomly select params from.
     vehicle_params = None
     # Parameters for a stationary battery for flexibility.
@@ -38,6 +47,16 @@ class Station(Model):
     # Will contain the probability of a vehicle having either a short or a long breaks for a given hour in the day.
     break_dist = {'Internal': None,
                   'External': None}
+    # Types of breaks in the order of the break distributions, which is also the order of their codes.
+    break_types = BREAK_TYPES
+    # Probability of each vehicle capacity and maximum charging power in the vehicle parameters.
+    capacity_weights = (0.15, 0.22, 0.29, 0.22, 0.12)
+    max_charge_weights = (0.14, 0.18, 0.21, 0.26, 0.21)
+    # Number of steps of the time resolution in each step of a step schedule derived from the arrivals, in the hours
+    # with fewer arrivals than average.
+    coarse_steps = 5
+    # Columns of the event log, named as the vehicle variables they hold.
+    event_columns = ['Step', 'AgentID', 'Event', 'Soc', 'power', 'Capacity', 'Type', 'BreakType', 'Waiting', 'Charged']
 
     @classmethod
     def set_seed(cls, seed):
@@ -86,7 +105,9 @@ class Station(Model):
                     dist.append((short, medium, long))
                 cls.break_dist[vehicle] = dist
 
-    def __init__(self, num_external, num_internal, chargers, battery, station_limit, time_resolution):
+    def __init__(self, num_external, num_internal, chargers, battery, station_limit, time_resolution, days=1,
+                 queue='fifo', vehicle_params=None, battery_params=None, large=False, step_schedule=None,
+                 model_period=None, agent_period=None, event_log=False):
         """
         Parameters
         ----------
@@ -96,6 +117,35 @@ class Station(Model):
         battery: bool
         station_limit: int
         time_resolution: int
+        days: int
+            Number of days to simulate. With more than one day the fleet visits the station again every day
+            and only daily aggregates are collected.
+        queue: str
+            Order in which waiting vehicles get a charger. 'fifo' for the order they got in line, 'charge_steps'
+            for the vehicles with the least remaining time for charging first, and 'unique_id' for the order of
+            their unique_id together with the arriving vehicles, as vehicles were matched before the waiting line.
+        vehicle_params: dict
+            Vehicle parameters for this station. If None, the parameters set for the Station class are used.
+        battery_params: dict
+            Battery parameters for this station. If None, the parameters set for the Station class are used.
+        large: bool
+            Large-station mode, where the vehicle variables are only collected in the last step of a simulation
+            while the station variables are collected in every step.
+        step_schedule: list or str
+            Length of each step in minutes that data is collected for, covering one day in multiples of the time
+            resolution, or 'arrivals' to derive the schedule from the arrival distributions. The vehicles are still
+            simulated with the time resolution, and the steps in between hold the data of the last collected step.
+            If None, data is collected in every step.
+        model_period: int
+            Minutes between the steps the station variables are collected in, as a multiple of the time resolution.
+            If None, they are collected in every step.
+        agent_period: int
+            Minutes between the steps the vehicle variables are collected in, as a multiple of the time resolution.
+            If None, they are collected in every step, or only in the last step in large-station mode.
+        event_log: bool
+            Log the events in the visit of each vehicle in the Events table instead of collecting the vehicle
+            variables in every step. The vehicle variables of any step follow from the events. The soc of the battery
+            is collected with the station variables.
         """
         super().__init__()
 
@@ -103,78 +153,719 @@ class Station(Model):
             raise ValueError('No arrival distribution was given.')
         elif self.short_break is None:
             raise ValueError('No break distributions were given.')
+        if days < 1:
+            raise ValueError('The simulation must cover at least one day.')
+        if queue not in ('fifo', 'charge_steps', 'unique_id'):
+            raise ValueError(f'Invalid queue order {queue} given.')
+        if step_schedule is not None and days > 1:
+            raise ValueError('A step schedule can only be used for one day.')
+        if (model_period is not None or agent_period is not None) and days > 1:
+            raise ValueError('Collection periods can only be used for one day.')
+        if agent_period is not None and large:
+            raise ValueError('The vehicle variables are only collected in the last step in large-station mode.')
+        if event_log and (days > 1 or large or agent_period is not None):
+            raise ValueError('An event log can only be used for one day, instead of collecting the vehicle variables.')
+        for period in (model_period, agent_period):
+            if period is not None and (period <= 0 or period % time_resolution):
+                raise ValueError(f'Collection period {period} is not a multiple of the time resolution.')
 
         # Station-------------------------------------------------------------------------------------------------------
 
+        if vehicle_params is not None:
+            self.vehicle_params = vehicle_params
+        if battery_params is not None:
+            self.battery_params = battery_params
+        # Shared grid connection that limits the charging power, if the station is part of a network.
+        self.grid = None
+
         num_vehicles = {'External': num_external, 'Internal': num_internal}
 
         # Simulation----------------------------------------------------------------------------------------------------
 
-        # Make a scheduler that splits each iteration into two steps
-        vehicle_steps = ['step_1', 'step_2']
+        # Make a scheduler that first disconnects vehicles that are done charging, then connects vehicles to chargers
+        # and lastly steps the agents. Vehicles are driven by the station and are not in the schedule.
+        vehicle_steps = ['model.release_chargers', 'model.assign_chargers', 'step_2']
         self.schedule = StagedActivation(model=self, stage_list=vehicle_steps,
-                                         shuffle=False, shuffle_between_stages=False)
+                                         shuffle=False, shuffle_between_stages=False, sort_agents=True)
         # Variable to stop simulation if set to False.
         self.running = True
+        # Number of days in a simulation.
+        self.days = days
         # Duration for a simulation in hours.
-        self.sim_time = 24
+        self.sim_time = 24 * days
         # Time that passes for each step in minutes.
         self.resolution = time_resolution
+        # Number of steps in one day.
+        self.day_steps = int(24 * (60 / self.resolution))
+        # Number of steps in a simulation.
+        self.horizon = self.days * self.day_steps
+        # If the vehicle variables are only collected in the last step.
+        self.large = large
+        # If the events of the vehicles are logged instead of collecting the vehicle variables.
+        self.event_log = event_log
         # The timestamp for the current step in a simulation.
         self.step_time = None
-        # List of timestamps for each simulation step.
+        # List of timestamps for each step of one day. Later days are offset from these.
         self.timestamps = pd.Series(pd.date_range('20230101 00:00:00',
-                                                  periods=self.sim_time * (60 / self.resolution),
+                                                  periods=self.day_steps,
                                                   freq=f'{self.resolution}T'))
+        # Hour of the day of each step.
+        self.step_hours = self.timestamps.dt.hour.tolist()
 
         # Agents--------------------------------------------------------------------------------------------------------
 
-        counter = 0
-        for vehicle_type, vehicle_num in num_vehicles.items():
-            for num in range(vehicle_num):
-                arrival_time = self.rand_generator.choice(self.timestamps, p=self.arrival_dist[vehicle_type])
-                hour = pd.Timestamp(arrival_time).hour
-                break_type = self.rand_generator.choice(['ShortBreak', 'MediumBreak', 'LongBreak'],
-                                                        p=self.break_dist[vehicle_type][hour])
-                cap = self.rand_generator.choice(self.vehicle_params[vehicle_type]['capacity'],
-                                                 p=[0.15, 0.22, 0.29, 0.22, 0.12])
-                charge = self.rand_generator.choice(self.vehicle_params[vehicle_type]['max_charge'],
-                                                    p=[0.14, 0.18, 0.21, 0.26, 0.21])
-                soc = self.rand_generator.normal(loc=50, scale=6)
-                obj = eval(vehicle_type)(unique_id=counter + num,
-                                         station=self,
-                                         random=self.rand_generator,
-                                         capacity=cap,
-                                         max_charge=charge,
-                                         arrival=arrival_time,
-                                         soc=soc,
-                                         break_type=break_type)
-                self.schedule.add(obj)
-            counter += vehicle_num
+        # Number of vehicles in each vehicle group.
+        self.num_vehicles = num_vehicles
+        # Cumulative distributions to draw the arrival step, break type, capacity and maximum charging power from.
+        self.arrival_cdf = {vehicle: self.get_cdf(self.arrival_dist[vehicle]) for vehicle in self.vehicle_classes}
+        self.break_cdf = {vehicle: [self.get_cdf(weights) for weights in self.break_dist[vehicle]]
+                          for vehicle in self.vehicle_classes}
+        self.capacity_cdf = self.get_cdf(self.capacity_weights)
+        self.max_charge_cdf = self.get_cdf(self.max_charge_weights)
+        # Steps data is collected in, or None if data is collected in every step.
+        self.collect_steps = self.get_collect_steps(step_schedule) if step_schedule is not None else None
+        # Vehicles that visit the station with their battery parameters and the soc they left with.
+        self.fleet = {}
+        # Records of vehicles that have not arrived at the station yet, sorted by arrival step.
+        self.pending = deque()
+        # The record of the current visit for each vehicle in the fleet.
+        self.records = []
+        # The record for each vehicle in the fleet, or the vehicle itself while it is at the station.
+        self.vehicles = []
+        # Number of vehicles that are at the station.
+        self.num_present = 0
+        # Unique ids of the vehicles that were at the station since the vehicle variables were last collected. The
+        # variables of the other vehicles have not changed, and are repeated.
+        self.visitors = set()
+        # Vehicles that arrived at the station in the current step.
+        self.arrivals = []
+        # Vehicles that left the station in the current step.
+        self.departed = []
+        # Order of the waiting queue.
+        self.queue_order = queue
+        # Heap of vehicles standing in line for a charger, as (priority, number in line, vehicle).
+        self.queue = []
+        # Heap of the steps at which waiting vehicles leave the station, as (step, number in line, vehicle).
+        self.deadlines = []
+        # Number of vehicles that have got in line.
+        self.queue_count = 0
+        # Heap of the steps at which charging vehicles disconnect, as (step, number of segment, vehicle).
+        self.releases = []
+        # Number of charging segments that have been started.
+        self.segment_count = 0
+        # If a vehicle disconnected from a charger in the current step.
+        self.capacity_freed = False
+        # Vehicle agents that are not in use and can be set up for the next arriving vehicle of their type.
+        self.idle_vehicles = {vehicle_type: [] for vehicle_type in self.vehicle_classes}
+
+        # The upper power limit at the station for when the battery starts discharging.
+        self.station_limit = station_limit
+        # Power of the chargers in each step, after vehicles have been connected and disconnected.
+        self.fleet_load = []
 
         if battery:
             # Add a local battery pack to the agent schedule.
             self.batt_power = 0
-            obj = Battery(unique_id=counter + 1,
-                          station=self,
-                          capacity=self.battery_params['capacity'],
-                          max_charge=self.battery_params['max_charge'],
-                          soc=self.battery_params['soc'],
-                          station_limit=station_limit)
-            self.schedule.add(obj)
+            self.battery = Battery(unique_id=num_external + num_internal + 1,
+                                   station=self,
+                                   capacity=self.battery_params['capacity'],
+                                   max_charge=self.battery_params['max_charge'],
+                                   soc=self.battery_params['soc'],
+                                   station_limit=station_limit)
+            self.schedule.add(self.battery)
+        else:
+            self.battery = None
 
         # List to contain all chargers at the station.
         self.charge_list = []
         for power, num in chargers.items():
             self.charge_list.extend([Charger(power=power, num_sockets=4) for _ in range(num)])
+        # Number of each charger in the list of chargers.
+        self.charger_numbers = {charger: number for number, charger in enumerate(self.charge_list)}
+        # Accessible power and number of the available chargers in sorted order, the entry of each charger in it, and
+        # the numbers of the chargers that changed since the list was last sorted.
+        self.free = sorted((charger.accessible_power, number) for number, charger in enumerate(self.charge_list))
+        self.free_entries = [(charger.accessible_power, number) for number, charger in enumerate(self.charge_list)]
+        self.changed_chargers = set()
+
+        if self.days > 1:
+            # Only daily aggregates are kept so that memory does not grow with the number of days.
+            self.datacollector = DataCollector(
+                tables={'Days': ['Day', 'Arrivals', 'Unserved', 'MeanWait', 'ArrivalSoc', 'DepartureSoc',
+                                 'FleetSoc', 'Energy', 'PeakPower', 'BattEnergy', 'BattSoc']})
+        else:
+            # Steps between the collected steps of the station and vehicle variables. The vehicle variables are
+            # always collected in the last step, and only in it in large-station mode.
+            model_steps = model_period // self.resolution if model_period is not None else 1
+            if self.large:
+                agent_steps = None
+            else:
+                agent_steps = agent_period // self.resolution if agent_period is not None else 1
+            model_reporters = {'Power': [self.get_station_power, [battery]], 'Time': 'step_time',
+                               'Batt_power': 'batt_power'}
+            if self.event_log:
+                if battery:
+                    model_reporters['Batt_soc'] = [self.get_batt_soc, []]
+                # Data collector for model variables, with the events of the vehicles in a table.
+                self.datacollector = DataCollector(
+                    model_reporters=model_reporters,
+                    tables={'Events': self.event_columns},
+                    model_period=model_steps, agent_period=None)
+            else:
+                # Data collector for model and agent variables.
+                self.datacollector = DataCollector(
+                    model_reporters=model_reporters,
+                    agent_reporters={'Soc': 'soc', 'Arrival': 'arrival', 'Capacity': 'capacity',
+                                     'Type': 'type_code', 'BreakType': 'break_code', 'power': 'power',
+                                     'Waiting': 'wait_time', 'Charged': 'no_charge'},
+                    agents=Station.get_reported_agents,
+                    # Agent types and break types are collected and saved as small integer codes.
+                    codes={'Type': AGENT_TYPES, 'BreakType': BREAK_TYPES},
+                    model_period=model_steps, agent_period=agent_steps, agent_last=self.horizon - 1)
+        # Running totals for the current day in multi-day simulations.
+        self.day_stats = None
+
+        self.populate()
+
+    def populate(self):
+        """
+        Draws the fleet and the first visit of each vehicle at the station.
+        """
+        counter = 0
+        for vehicle_type, vehicle_num in self.num_vehicles.items():
+            for num in range(vehicle_num):
+                arrival_step, break_type = self.sample_visit(vehicle_type, day=0)
+                cap = self.vehicle_params[vehicle_type]['capacity'][self.draw(self.capacity_cdf)]
+                charge = self.vehicle_params[vehicle_type]['max_charge'][self.draw(self.max_charge_cdf)]
+                soc = self.rand_generator.normal(loc=50, scale=6)
+                self.fleet[counter + num] = dict(type=vehicle_type, capacity=cap, max_charge=charge, soc=soc,
+                                                 present=True)
+                self.records.append(self.make_record(counter + num, arrival_step, break_type, soc))
+            counter += vehicle_num
+        self.vehicles.extend(self.records)
+        self.pending.extend(sorted(self.records, key=attrgetter('arrival_step')))
+        if self.event_log and self.battery is not None:
+            # The battery is at the station from the first step.
+            self.log_event(self.battery, 'Arrive')
+
+        if self.days > 1:
+            self.reset_day_stats()
+            self.day_stats['Arrivals'] = len(self.fleet)
+            self.day_stats['ArrivalSoc'] = sum(member['soc'] for member in self.fleet.values())
+
+    def reset(self, seed=None):
+        """
+        Sets the station back to its initial state with a new fleet, so that it can be simulated again without
+        being built from scratch. Chargers, battery, scheduler, data collector and vehicle agents are reused.
+
+        Parameters
+        ----------
+        seed: int
+            Seed for a new random generator for this station. If None, the current random generator is used.
+        """
+        if seed is not None:
+            self.rand_generator = default_rng(seed=seed)
+
+        for vehicle in self.vehicles:
+            if isinstance(vehicle, Vehicle):
+                self.idle_vehicles[vehicle.type].append(vehicle)
+        self.schedule.clear()
+        for charger in self.charge_list:
+            charger.reset()
+        self.free = sorted((charger.accessible_power, number) for number, charger in enumerate(self.charge_list))
+        self.free_entries = [(charger.accessible_power, number) for number, charger in enumerate(self.charge_list)]
+        self.changed_chargers.clear()
+        if self.battery is not None:
+            self.battery.reset()
+            self.batt_power = 0
+            self.schedule.add(self.battery)
+        self.datacollector.clear()
+        self.fleet_load.clear()
+
+        self.running = True
+        self.step_time = None
+        self.fleet.clear()
+        self.pending.clear()
+        self.records.clear()
+        self.vehicles.clear()
+        self.num_present = 0
+        self.visitors.clear()
+        self.arrivals.clear()
+        self.departed.clear()
+        self.queue.clear()
+        self.deadlines.clear()
+        self.queue_count = 0
+        self.releases.clear()
+        self.segment_count = 0
+        self.capacity_freed = False
+
+        self.populate()
+
+    def get_collect_steps(self, step_schedule):
+        """
+        Finds the steps data is collected in from a step schedule.
+
+        Returns
+        -------
+        Sorted list of steps.
+        """
+        if step_schedule == 'arrivals':
+            step_schedule = self.get_arrival_schedule()
+        elif not isinstance(step_schedule, (list, tuple)):
+            # A single step length is rejected, as it is what a parameter sweep over the schedule would pass.
+            raise ValueError(f'Invalid step schedule {step_schedule} given, it must be a list of step lengths.')
+        steps = []
+        step = 0
+        for minutes in step_schedule:
+            if minutes <= 0 or minutes % self.resolution:
+                raise ValueError(f'Step length {minutes} is not a multiple of the time resolution.')
+            steps.append(step)
+            step += minutes // self.resolution
+        if step != self.day_steps:
+            raise ValueError('The step schedule must cover one day.')
+        if self.large and steps[-1] != self.horizon - 1:
+            # The vehicle variables are collected in the last step in large-station mode.
+            steps.append(self.horizon - 1)
+        return steps
+
+    def get_arrival_schedule(self):
+        """
+        Makes a step schedule with steps of the time resolution in the hours where more vehicles than average arrive,
+        and steps of coarse_steps times the time resolution in the other hours.
+
+        Returns
+        -------
+        List with the length of each step in minutes.
+        """
+        hour_steps = self.day_steps // 24
+        arrivals = sum(num * np.asarray(self.arrival_dist[vehicle]) for vehicle, num in self.num_vehicles.items())
+        hourly = arrivals.reshape(24, hour_steps).sum(axis=1)
+        lengths = []
+        for weight in hourly:
+            if weight >= hourly.mean():
+                lengths.extend([self.resolution] * hour_steps)
+            else:
+                full, rest = divmod(hour_steps, self.coarse_steps)
+                lengths.extend([self.coarse_steps * self.resolution] * full)
+                if rest:
+                    lengths.append(rest * self.resolution)
+        return lengths
+
+    def sample_visit(self, vehicle_type, day):
+        """
+        Draws the arrival step and the type of break for a visit of a vehicle at the station.
+
+        Returns
+        -------
+        Arrival step and break type.
+        """
+        day_step = self.draw(self.arrival_cdf[vehicle_type])
+        hour = self.step_hours[day_step]
+        break_type = self.break_types[self.draw(self.break_cdf[vehicle_type][hour])]
+        return day * self.day_steps + day_step, break_type
+
+    @staticmethod
+    def get_cdf(weights):
+        """
+        Finds the cumulative distribution of a list of probabilities, normalized in the same way as in
+        Generator.choice. Hours without any probability for a break are left at zero, since no vehicle arrives then.
+
+        Returns
+        -------
+        Numpy array with the cumulative distribution.
+        """
+        cdf = np.asarray(weights, dtype=float).cumsum()
+        if cdf[-1] > 0:
+            cdf /= cdf[-1]
+        return cdf
+
+    def draw(self, cdf):
+        """
+        Draws an index from a cumulative distribution. Gives the same result and uses the random generator in the
+        same way as Generator.choice with the probabilities, without checking and summing them again for every draw.
+
+        Returns
+        -------
+        The drawn index.
+        """
+        return int(cdf.searchsorted(self.rand_generator.random(), side='right'))
+
+    def make_record(self, unique_id, arrival_step, break_type, soc):
+        """
+        Makes the record for a visit of a vehicle from the fleet at the station.
+
+        Returns
+        -------
+        Record of the vehicle.
+        """
+        member = self.fleet[unique_id]
+        day, day_step = divmod(arrival_step, self.day_steps)
+        arrival_time = self.timestamps.values[day_step]
+        if day:
+            arrival_time = arrival_time + np.timedelta64(day, 'D')
+        charge_steps = self.vehicle_classes[member['type']].sample_charge_steps(self.rand_generator,
+                                                                                self.resolution, break_type)
+        return VehicleRecord(unique_id=unique_id,
+                             vehicle_type=member['type'],
+                             break_type=break_type,
+                             arrival=arrival_time,
+                             arrival_step=arrival_step,
+                             capacity=member['capacity'],
+                             max_charge=member['max_charge'],
+                             soc=soc,
+                             charge_steps=charge_steps)
+
+    def admit_arrivals(self):
+        """
+        Makes vehicles out of the records of the vehicles that arrive at the station in the current step. Idle
+        vehicle agents are set up for the arriving vehicles before new ones are made.
+        """
+        while self.pending and self.pending[0].arrival_step <= self.schedule.steps:
+            record = self.pending.popleft()
+            idle = self.idle_vehicles[record.type]
+            if idle:
+                obj = idle.pop()
+                obj.reset(unique_id=record.unique_id,
+                          arrival=record.arrival,
+                          capacity=record.capacity,
+                          max_charge=record.max_charge,
+                          soc=record.soc,
+                          charge_steps=record.charge_steps,
+                          break_type=record.break_type)
+            else:
+                obj = self.vehicle_classes[record.type](unique_id=record.unique_id,
+                                                        station=self,
+                                                        arrival=record.arrival,
+                                                        capacity=record.capacity,
+                                                        max_charge=record.max_charge,
+                                                        soc=record.soc,
+                                                        charge_steps=record.charge_steps,
+                                                        break_type=record.break_type)
+            self.vehicles[record.unique_id] = obj
+            self.arrivals.append(obj)
+            self.num_present += 1
+            self.visitors.add(record.unique_id)
+            if self.event_log:
+                self.log_event(obj, 'Arrive')
+
+    @staticmethod
+    def best_charger(target_power, free):
+        """
+        Finds the available charger for which the accessible power is closest to the target power. Of the chargers
+        that are as close, the one that comes first in the list of chargers is chosen.
+
+        Parameters
+        ----------
+        target_power: float
+        free: list of tuple
+            Accessible power and index of each available charger, in sorted order.
 
-        # Data collector for model and agent variables.
-        self.datacollector = DataCollector(
-            model_reporters={'Power': [self.get_station_power, [battery]], 'Time': 'step_time',
-                             'Batt_power': 'batt_power'},
-            agent_reporters={'Soc': 'soc', 'Arrival': 'arrival', 'Capacity': 'capacity',
-                             'Type': 'type', 'BreakType': 'break_type', 'power': 'power',
-                             'Waiting': 'wait_time', 'Charged': 'no_charge'})
+        Returns
+        -------
+        Index of the charger, or None if no charger is available.
+        """
+        if not free:
+            return None
+        # First charger with more power than the target, and the first charger with the most power up to the target.
+        position = bisect_right(free, (target_power, math.inf))
+        best = None
+        if position > 0:
+            best = free[bisect_left(free, (free[position - 1][0], -1))]
+        if position < len(free):
+            above = free[position]
+            if best is None:
+                best = above
+            else:
+                below_gap = target_power - best[0]
+                above_gap = above[0] - target_power
+                if above_gap < below_gap or (above_gap == below_gap and above[1] < best[1]):
+                    best = above
+        return best[1]
+
+    def charger_changed(self, charger):
+        """
+        Registers that the accessible power or the free sockets of a charger changed, so that its place in the sorted
+        list of available chargers is found again before the next vehicles are matched.
+        """
+        self.changed_chargers.add(self.charger_numbers[charger])
+
+    def sort_chargers(self):
+        """
+        Moves the chargers that changed to their new place in the sorted list of available chargers, or out of it if
+        they are no longer available.
+        """
+        for number in self.changed_chargers:
+            entry = self.free_entries[number]
+            if entry is not None:
+                del self.free[bisect_left(self.free, entry)]
+            charger = self.charge_list[number]
+            entry = (charger.accessible_power, number) if charger.available else None
+            if entry is not None:
+                insort(self.free, entry)
+            self.free_entries[number] = entry
+        self.changed_chargers.clear()
+
+    def find_charger(self, vehicle):
+        """
+        Finds the charger for a vehicle, if there is power left on the grid connection of the station.
+
+        Returns
+        -------
+        Index of the charger, or None if no charger is available.
+        """
+        if self.grid is not None and self.grid.headroom <= 0:
+            return None
+        return self.best_charger(vehicle.target_power, self.free)
+
+    def enqueue(self, vehicle):
+        """
+        Puts a vehicle that did not find a charger in line and sets the step at which it leaves if it is still
+        waiting then.
+        """
+        step = self.schedule.steps
+        vehicle.state |= WAITING
+        vehicle.wait_start = step
+        vehicle.queue_seq = self.queue_count
+        self.queue_count += 1
+        if self.queue_order == 'fifo':
+            priority = vehicle.queue_seq
+        elif self.queue_order == 'unique_id':
+            priority = vehicle.unique_id
+        else:
+            # Step at which the vehicle runs out of time for charging.
+            priority = step + vehicle.charge_steps
+        heapq.heappush(self.queue, (priority, vehicle.queue_seq, vehicle))
+        wait_steps = vehicle.get_wait_steps()
+        if wait_steps is None:
+            return
+        elif wait_steps <= 1:
+            vehicle.stop_waiting()
+        else:
+            heapq.heappush(self.deadlines, (step + wait_steps - 1, vehicle.queue_seq, vehicle))
+
+    def schedule_release(self, vehicle):
+        """
+        Registers the step at which a vehicle that started a new charging segment disconnects from its charger.
+        """
+        if self.event_log:
+            # The first segment starts when the vehicle gets a charger, the later ones when its power changes.
+            self.log_event(vehicle, 'Connect' if vehicle.charge_seq is None else 'Power')
+        vehicle.charge_seq = self.segment_count
+        self.segment_count += 1
+        heapq.heappush(self.releases, (vehicle.segment_end, vehicle.charge_seq, vehicle))
+
+    def release_chargers(self):
+        """
+        Disconnects the vehicles that are done charging in this step from their chargers, in order of their
+        unique_id.
+        """
+        step = self.schedule.steps
+        done = []
+        while self.releases and self.releases[0][0] <= step:
+            _, seq, vehicle = heapq.heappop(self.releases)
+            # Skip segments that ended early because the charging power changed.
+            if vehicle.state & CHARGING and vehicle.charge_seq == seq:
+                done.append(vehicle)
+        done.sort(key=attrgetter('unique_id'))
+        for vehicle in done:
+            vehicle.disconnect_charger()
+
+    def assign_chargers(self):
+        """
+        Connects the vehicles waiting in line and the vehicles arriving in this step to chargers, and lets vehicles
+        that have waited for as long as they can leave. The waiting vehicles are matched from the head of the queue
+        first, then the arriving vehicles in order of their unique_id. With the 'unique_id' queue order, the waiting
+        and arriving vehicles are matched together in order of their unique_id, as they were before the waiting
+        line. Vehicles that arrive when no charger is available get in line.
+
+        The available chargers are kept sorted by their accessible power across steps, and only the chargers that
+        changed are moved. Each vehicle finds its charger in the sorted list by bisection, and the charger it is
+        connected to is moved before the next vehicle is matched.
+        """
+        if self.capacity_freed or self.arrivals:
+            self.capacity_freed = False
+            self.sort_chargers()
+
+            arrivals = deque(self.arrivals)
+            self.arrivals.clear()
+            while self.queue or arrivals:
+                if self.queue:
+                    priority, seq, vehicle = self.queue[0]
+                    # Skip vehicles that have left the line since they got in it.
+                    if not vehicle.state & WAITING or vehicle.queue_seq != seq:
+                        heapq.heappop(self.queue)
+                        continue
+                # The arriving vehicles come after the line, or between the waiting vehicles by their unique_id.
+                waiting = bool(self.queue) and (self.queue_order != 'unique_id' or not arrivals
+                                                or priority < arrivals[0].unique_id)
+                vehicle = self.queue[0][2] if waiting else arrivals[0]
+                index = self.find_charger(vehicle)
+                if index is None:
+                    # No charger is available for any vehicle, so the arriving vehicles get in line.
+                    break
+                if waiting:
+                    heapq.heappop(self.queue)
+                else:
+                    arrivals.popleft()
+                self.connect(vehicle, index)
+            for vehicle in arrivals:
+                self.enqueue(vehicle)
+
+        step = self.schedule.steps
+        while self.deadlines and self.deadlines[0][0] <= step:
+            _, seq, vehicle = heapq.heappop(self.deadlines)
+            if vehicle.state & WAITING and vehicle.queue_seq == seq:
+                vehicle.stop_waiting()
+
+    def connect(self, vehicle, index):
+        """
+        Connects a vehicle to the charger with the given index and updates the sorted list of available chargers.
+        """
+        charger = self.charge_list[index]
+        # If what's available is less or equal to the requested power we take all the available power,
+        # otherwise we only take what was requested.
+        if charger.accessible_power <= vehicle.target_power:
+            power = charger.accessible_power
+        else:
+            power = vehicle.target_power
+        if self.grid is not None:
+            power = min(power, self.grid.headroom)
+            self.grid.take(power)
+        vehicle.connect_charger(charger, power)
+        self.charger_changed(charger)
+        self.sort_chargers()
+
+    def vehicle_left(self, vehicle):
+        """
+        Registers that a vehicle has left the station.
+        """
+        self.departed.append(vehicle)
+        if self.event_log:
+            self.log_event(vehicle, 'Unserved' if vehicle.no_charge else 'Disconnect')
+
+    def log_event(self, agent, event):
+        """
+        Adds an event in the visit of a vehicle, or of the battery, to the event log. The soc of a charging vehicle
+        is logged as it was at the start of its charging segment, from which the soc in the following steps is found
+        with the charging power.
+
+        Parameters
+        ----------
+        agent: Vehicle or Battery
+        event: str
+            One of the event types in EVENT_TYPES.
+        """
+        soc = agent.soc_start if isinstance(agent, Vehicle) else agent.soc
+        self.datacollector.add_table_row('Events', {
+            'Step': self.schedule.steps, 'AgentID': agent.unique_id, 'Event': EVENT_CODES[event], 'Soc': soc,
+            'power': agent.power, 'Capacity': agent.capacity, 'Type': agent.type_code, 'BreakType': agent.break_code,
+            'Waiting': agent.wait_time, 'Charged': agent.no_charge})
+
+    def retire_departed(self):
+        """
+        Replaces the vehicles that left the station in the current step by their records.
+        """
+        for vehicle in self.departed:
+            record = self.records[vehicle.unique_id]
+            record.retire(vehicle)
+            self.vehicles[vehicle.unique_id] = record
+            self.idle_vehicles[vehicle.type].append(vehicle)
+            self.num_present -= 1
+            if self.days > 1:
+                member = self.fleet[vehicle.unique_id]
+                member['soc'] = vehicle.soc
+                member['present'] = False
+                self.day_stats['Departures'] += 1
+                self.day_stats['Waiting'] += vehicle.wait_time
+                self.day_stats['DepartureSoc'] += vehicle.soc
+                if vehicle.no_charge:
+                    self.day_stats['Unserved'] += 1
+        self.departed.clear()
+
+    def get_reported_agents(self):
+        """
+        Finds all agents to collect data from. Vehicles that are not at the station are represented by their
+        records.
+
+        Returns
+        -------
+        List of vehicles and the battery.
+        """
+        if self.battery is not None:
+            return self.vehicles + [self.battery]
+        return self.vehicles
+
+    def start_day(self, day):
+        """
+        Lets every vehicle in the fleet that is not still at the station visit it again on the given day.
+        The energy used on the road since the last visit is drawn from the same distribution as the initial soc.
+        """
+        records = []
+        for unique_id, member in self.fleet.items():
+            if member['present']:
+                continue
+            arrival_step, break_type = self.sample_visit(member['type'], day)
+            used = 100 - self.rand_generator.normal(loc=50, scale=6)
+            soc = max(member['soc'] - used, 0)
+            member['present'] = True
+            record = self.make_record(unique_id, arrival_step, break_type, soc)
+            self.records[unique_id] = record
+            self.vehicles[unique_id] = record
+            records.append(record)
+            self.day_stats['ArrivalSoc'] += soc
+        self.pending.extend(sorted(records, key=attrgetter('arrival_step')))
+        self.day_stats['Arrivals'] = len(records)
+
+    def reset_day_stats(self):
+        """
+        Clears the running totals for the current day.
+        """
+        self.day_stats = dict(Arrivals=0, Unserved=0, Departures=0, Waiting=0, ArrivalSoc=0, DepartureSoc=0,
+                              Energy=0, PeakPower=0, BattEnergy=0)
+
+    def update_day_stats(self):
+        """
+        Adds the current step to the running totals for the day.
+        Closes the day in the data collector after its last step and starts the next one.
+        """
+        stats = self.day_stats
+        power = self.get_station_power(battery=False)
+        stats['Energy'] += power * (self.resolution / 60)
+        if self.battery is not None:
+            stats['BattEnergy'] += abs(self.batt_power) * (self.resolution / 60)
+            power += self.batt_power
+        stats['PeakPower'] = max(stats['PeakPower'], power)
+
+        day, day_step = divmod(self.schedule.steps, self.day_steps)
+        if day_step == 0:
+            departures = stats['Departures']
+            self.datacollector.add_table_row('Days', {
+                'Day': day - 1,
+                'Arrivals': stats['Arrivals'],
+                'Unserved': stats['Unserved'],
+                'MeanWait': stats['Waiting'] / departures if departures else 0,
+                'ArrivalSoc': stats['ArrivalSoc'] / stats['Arrivals'] if stats['Arrivals'] else 0,
+                'DepartureSoc': stats['DepartureSoc'] / departures if departures else 0,
+                'FleetSoc': sum(member['soc'] for member in self.fleet.values()) / len(self.fleet),
+                'Energy': stats['Energy'],
+                'PeakPower': stats['PeakPower'],
+                'BattEnergy': stats['BattEnergy'],
+                'BattSoc': self.battery.soc if self.battery is not None else None})
+            self.reset_day_stats()
+            if day == self.days:
+                self.running = False
+            else:
+                self.start_day(day)
+
+    def get_batt_soc(self):
+        """
+        Finds the soc of the battery.
+
+        Returns
+        -------
+        Soc of the battery.
+        """
+        return self.battery.soc
 
     def get_station_power(self, battery):
         """
@@ -190,16 +881,233 @@ class Station(Model):
         else:
             return sum(power_sum)
 
+    def replay(self, configurations):
+        """
+        Runs batteries and station limits against the power the chargers used in the simulation. The battery does
+        not change what the vehicles do, so a simulated fleet can be reused for any number of battery configurations.
+
+        Parameters
+        ----------
+        configurations: list of dict
+            Battery configurations with any of capacity, max_charge, soc and station_limit. Missing values are taken
+            from the battery parameters and station limit of the station.
+
+        Returns
+        -------
+        List of rows for each configuration, with a row for each step, or with a row for each day in multi-day
+        simulations. The steps line up with the collected data, where each step shows the battery after the step
+        before.
+        """
+        defaults = {**(self.battery_params or {}), 'station_limit': self.station_limit}
+        configurations = [{**defaults, **configuration} for configuration in configurations]
+        for configuration in configurations:
+            missing = {'capacity', 'max_charge', 'soc', 'station_limit'} - set(configuration)
+            if missing:
+                raise ValueError(f'Missing battery parameters {sorted(missing)} for the replay.')
+        if not configurations:
+            return []
+
+        params = {key: np.array([configuration[key] for configuration in configurations], dtype=float)
+                  for key in ('capacity', 'max_charge', 'soc', 'station_limit')}
+        load = np.tile(np.asarray(self.fleet_load, dtype=float), (len(configurations), 1))
+        batt_power, batt_soc, power = dispatch_battery(load, params, params['station_limit'], self.resolution)
+
+        rows = []
+        if self.days > 1:
+            days = load.shape[1] // self.day_steps
+            shape = (len(configurations), days, self.day_steps)
+            peak_power = power[:, :days * self.day_steps].reshape(shape).max(axis=2)
+            batt_energy = (np.abs(batt_power[:, :days * self.day_steps]) * (self.resolution / 60)).reshape(shape).sum(
+                axis=2)
+            day_soc = batt_soc[:, self.day_steps - 1::self.day_steps]
+            for index, configuration in enumerate(configurations):
+                for day in range(days):
+                    rows.append({'Replay': index, **configuration, 'Day': day,
+                                 'PeakPower': peak_power[index, day],
+                                 'BattEnergy': batt_energy[index, day],
+                                 'BattSoc': day_soc[index, day]})
+        else:
+            # The data collected in a step shows the station after the step before.
+            batt_power = np.hstack([np.zeros((len(configurations), 1)), batt_power[:, :-1]])
+            batt_soc = np.hstack([params['soc'][:, None], batt_soc[:, :-1]])
+            power = np.hstack([np.zeros((len(configurations), 1)), power[:, :-1]])
+            timestamps = [self.get_step_time(step) for step in range(load.shape[1])]
+            for index, configuration in enumerate(configurations):
+                rows.extend({'Replay': index, **configuration, 'Step': step, 'Time': timestamps[step],
+                             'Power': power[index, step], 'Batt_power': batt_power[index, step],
+                             'Batt_soc': batt_soc[index, step]}
+                            for step in range(load.shape[1]))
+        return rows
+
+    def get_step_time(self, step):
+        """
+        Finds the timestamp of a step.
+
+        Returns
+        -------
+        Timestamp of the step.
+        """
+        day, day_step = divmod(step, self.day_steps)
+        if day:
+            return self.timestamps[day_step] + pd.Timedelta(days=day)
+        return self.timestamps[day_step]
+
+    def get_idle_end(self):
+        """
+        Checks if nothing happens at the station from the current step on, meaning that no vehicle is at the station
+        and the battery is at rest.
+
+        Returns
+        -------
+        The first step in which something can happen again, which is the next arrival, the start of the next day,
+        the next step data is collected in or the end of the simulation. None if the station is not idle.
+        """
+        if self.num_present:
+            return None
+        if self.battery is not None and (self.batt_power != 0 or not self.battery.is_idle()):
+            return None
+        # In large-station mode the last step is not skipped, since the vehicle variables are collected in it.
+        end = self.horizon - 1 if self.large else self.horizon
+        if self.pending:
+            end = min(end, self.pending[0].arrival_step)
+        if self.days > 1:
+            end = min(end, (self.schedule.steps // self.day_steps + 1) * self.day_steps)
+        if self.collect_steps is not None:
+            index = bisect_left(self.collect_steps, self.schedule.steps + 1)
+            if index < len(self.collect_steps):
+                end = min(end, self.collect_steps[index])
+        return end
+
+    def fast_forward(self, end):
+        """
+        Skips the steps up to the given step, in which nothing happens at the station. The data collected in the
+        current step is repeated for the skipped steps.
+
+        Parameters
+        ----------
+        end: int
+            The first step in which something can happen again.
+        """
+        start = self.schedule.steps
+        if self.days > 1:
+            # Nothing is added to the daily totals while the station is idle.
+            self.datacollector.fill(self, end - start - 1)
+        else:
+            self.datacollector.fill(self, end - start - 1,
+                                    model_vars={'Time': [self.get_step_time(step) for step in range(start + 1, end)]})
+        self.schedule.advance(end - start)
+        self.fleet_load.extend([0] * (end - start))
+
+    def collect(self, hold=False):
+        """
+        Collects the data of the current step. Of the vehicles, only the ones that were at the station since the
+        vehicle variables were last collected are read, and the records of the others are repeated.
+
+        Parameters
+        ----------
+        hold: bool
+            If the vehicle variables are held in the following steps, even if they are not due in this one.
+        """
+        datacollector = self.datacollector
+        if not datacollector.agent_reporters or not (hold or datacollector.is_agent_step(self.schedule.steps)):
+            datacollector.collect(self, hold)
+            return
+        changed = {unique_id: self.vehicles[unique_id] for unique_id in self.visitors}
+        if self.battery is not None:
+            # The battery is reported after the vehicles.
+            changed[len(self.vehicles)] = self.battery
+        datacollector.collect(self, hold, changed=changed)
+        # Vehicles that left the station have now been read as records.
+        self.visitors = {unique_id for unique_id in self.visitors if isinstance(self.vehicles[unique_id], Vehicle)}
+
+    def is_collect_step(self, step):
+        """
+        Checks if data is collected in a step of the step schedule.
+        """
+        index = bisect_left(self.collect_steps, step)
+        return index < len(self.collect_steps) and self.collect_steps[index] == step
+
+    def skip_to_event(self):
+        """
+        Skips the steps up to the next step in which a vehicle arrives, disconnects or stops waiting, or in which
+        data is collected. Nothing changes at the station in between other than the soc of the charging vehicles,
+        which is only read when data is collected. Only used without a battery, since it acts in every step.
+        """
+        start = self.schedule.steps
+        end = self.horizon
+        index = bisect_left(self.collect_steps, start)
+        if index < len(self.collect_steps):
+            end = self.collect_steps[index]
+        if self.pending:
+            end = min(end, self.pending[0].arrival_step)
+        if self.releases:
+            end = min(end, self.releases[0][0])
+        if self.deadlines:
+            end = min(end, self.deadlines[0][0])
+        if end > start:
+            self.datacollector.fill(self, end - start,
+                                    model_vars={'Time': [self.get_step_time(step) for step in range(start, end)]})
+            self.fleet_load.extend([self.fleet_load[-1]] * (end - start))
+            self.schedule.advance(end - start)
+
+    def skip_window(self):
+        """
+        Skips the steps up to the next step in which a vehicle arrives or disconnects, while no vehicle is waiting for
+        a charger. Nothing changes at the station in between other than the soc of the charging vehicles, which
+        follows from their charging segments, so the data of each skipped step is collected without stepping the
+        agents. When chargers run out and vehicles get in line, the station is stepped in every step until the line
+        is empty again. Only used for one day, without a battery, which acts in every step, and without a grid
+        connection, through which vehicles leaving other stations can raise the power of the vehicles here.
+        """
+        end = self.horizon
+        if self.pending:
+            end = min(end, self.pending[0].arrival_step)
+        if self.releases:
+            end = min(end, self.releases[0][0])
+        power = self.fleet_load[-1]
+        while self.schedule.steps < end:
+            self.step_time = self.get_step_time(self.schedule.steps)
+            self.collect()
+            self.fleet_load.append(power)
+            self.schedule.advance(1)
+
     def step(self):
         """
         Actions to execute for each iteration of a simulation.
         """
         # Find correct timestamp of the current step.
-        self.step_time = self.timestamps[self.schedule.steps]
-        # Collect data from the current step.
-        self.datacollector.collect(self)
-        # Iterate through all agents (vehicles, batteries) in the model.
-        self.schedule.step()
+        self.step_time = self.get_step_time(self.schedule.steps)
+        # Let vehicles arriving in this step into the station.
+        self.admit_arrivals()
+        if self.collect_steps is None:
+            # Collect data from the current step.
+            self.collect()
+        elif self.is_collect_step(self.schedule.steps):
+            # Collect data from the current step, and keep the vehicle variables if they are due before the next
+            # collected step, since that holds the data of this one.
+            index = bisect_left(self.collect_steps, self.schedule.steps + 1)
+            end = self.collect_steps[index] if index < len(self.collect_steps) else self.horizon
+            self.collect(hold=bool(self.datacollector.agent_steps(self.schedule.steps + 1, end)))
+        else:
+            # Hold the data of the last collected step.
+            self.datacollector.fill(self, 1, model_vars={'Time': [self.step_time]})
+        idle_end = self.get_idle_end()
+        if idle_end is not None and idle_end > self.schedule.steps + 1:
+            # Jump to the next step in which something happens.
+            self.fast_forward(idle_end)
+        else:
+            # Iterate through all agents (vehicles, batteries) in the model.
+            self.schedule.step()
+            self.fleet_load.append(self.get_station_power(battery=False))
+            self.retire_departed()
+            if self.collect_steps is not None and self.battery is None:
+                self.skip_to_event()
+            elif self.days == 1 and self.battery is None and self.grid is None and not self.queue:
+                self.skip_window()
+        if self.days > 1:
+            self.update_day_stats()
+        elif self.schedule.steps >= self.horizon:
+            self.running = False
 
 
 if __name__ == '__main__':
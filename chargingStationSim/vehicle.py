@@ -1,19 +1,77 @@
 # -*- encoding: utf-8 -*-
 """
-The file contains the Vehicle class.
+The file contains the Vehicle class and the record kept for vehicles that are not at the station.
 """
 
 __author__ = 'Lina Grünbeck / lina.grunbeck@gmail.com'
 
+import math
+
 from chargingStationSim.mesa_mod import Agent
 
+# Flags for the state of a vehicle at the station, combined in the state attribute of each vehicle.
+CHARGING = 1
+WAITING = 2
+LEFT = 4
+
+# Agent types and break types, in the order of the codes they are reported and saved with. Agents without a break
+# type report the code -1.
+AGENT_TYPES = ('External', 'Internal', 'Battery')
+BREAK_TYPES = ('ShortBreak', 'MediumBreak', 'LongBreak')
+AGENT_CODES = {agent_type: code for code, agent_type in enumerate(AGENT_TYPES)}
+BREAK_CODES = {break_type: code for code, break_type in enumerate(BREAK_TYPES)}
+# Events in the visit of a vehicle at the station, in the order of the codes they are logged with.
+EVENT_TYPES = ('Arrive', 'Connect', 'Power', 'Disconnect', 'Unserved')
+EVENT_CODES = {event: code for code, event in enumerate(EVENT_TYPES)}
+
+
+class VehicleRecord:
+    """
+    Compact record of a vehicle that has not arrived at the station yet or that has left it. Holds the
+    parameters drawn for the visit and the values that are reported for the vehicle.
+    """
+    __slots__ = ('unique_id', 'type', 'type_code', 'break_type', 'break_code', 'arrival', 'arrival_step',
+                 'capacity', 'max_charge', 'soc', 'charge_steps', 'power', 'wait_time', 'no_charge')
+
+    def __init__(self, unique_id, vehicle_type, break_type, arrival, arrival_step, capacity, max_charge, soc,
+                 charge_steps):
+        self.unique_id = unique_id
+        self.type = vehicle_type
+        self.type_code = AGENT_CODES[vehicle_type]
+        self.break_type = break_type
+        self.break_code = BREAK_CODES[break_type]
+        self.arrival = arrival
+        self.arrival_step = arrival_step
+        self.capacity = capacity
+        self.max_charge = max_charge
+        self.soc = soc
+        self.charge_steps = charge_steps
+        self.power = 0
+        self.wait_time = 0
+        self.no_charge = False
+
+    def retire(self, vehicle):
+        """
+        Stores the final state of a vehicle that left the station.
+        """
+        self.soc = vehicle.soc
+        self.power = vehicle.power
+        self.wait_time = vehicle.wait_time
+        self.no_charge = vehicle.no_charge
+
+# ----------------------------------------------------------------------------------------------------------------------
+
 
 class Vehicle(Agent):
     """
     Base class for all vehicles charging at a charging station.
     """
+    __slots__ = ('station', 'resolution', 'capacity', 'max_charge', 'soc_start', 'soc_rate', 'segment_start',
+                 'segment_end', 'target_reached', 'charge_seq', 'arrival', 'charge_steps', 'break_type', 'break_code',
+                 'wait_start', 'waited', 'queue_seq', 'target_power', 'target_soc', 'power', 'charger', 'state',
+                 'no_charge')
 
-    def __init__(self, unique_id, station, random, arrival, capacity, max_charge, soc):
+    def __init__(self, unique_id, station, arrival, capacity, max_charge, soc, charge_steps, break_type):
         """
         Parameters
         ----------
@@ -21,8 +79,6 @@ class Vehicle(Agent):
             Id for the vehicle.
         station: mesa.model
             Instance of the station that contains the vehicle.
-        random: numpy random generator instance
-
         arrival: pandas timestamp
             The arrival time of the vehicle at the station.
         capacity: int
@@ -31,24 +87,53 @@ class Vehicle(Agent):
             Maximum power at which the vehicle can charge in kW.
         soc: float
             State of Charge of the battery at initialization.
+        charge_steps: int
+            Maximum steps that the vehicle has time to charge.
+        break_type: str
+            The type of rest period the vehicle has at the station.
         """
         super().__init__(unique_id, station)
 
-        self.rand_generator = random
         self.station = station
         # Time per iteration step in minutes.
         self.resolution = station.resolution
+        self.reset(unique_id, arrival, capacity, max_charge, soc, charge_steps, break_type)
+
+    def reset(self, unique_id, arrival, capacity, max_charge, soc, charge_steps, break_type):
+        """
+        Sets the vehicle up for a new visit at the station, so that the agent can be reused.
+        """
+        self.unique_id = unique_id
         # Set the battery capacity and maximum charging power for the vehicle.
         self.capacity = capacity
         self.max_charge = max_charge
-        # State of Charge of the vehicle battery in percentage.
-        self.soc = soc
+        # State of Charge of the vehicle battery in percentage when the current charging segment started. Equal to
+        # the current soc while the vehicle is not charging.
+        self.soc_start = soc
+        # Increase of the soc for each step in the current charging segment.
+        self.soc_rate = 0
+        # The step the current charging segment started, and the step the vehicle disconnects if the charging
+        # power does not change before.
+        self.segment_start = None
+        self.segment_end = None
+        # If the vehicle reaches its target soc at the end of the current charging segment.
+        self.target_reached = False
+        # Number of the current charging segment in the release events of the station.
+        self.charge_seq = None
         # Arrival time at charging station.
         self.arrival = arrival
-        # Default maximum steps that the vehicle charges.
-        self.charge_steps = self.get_charge_steps(mean=45, std=2)
-        # Counter for the amount of minutes the vehicle has to stand in line at the station.
-        self.wait_time = 0
+        # Maximum steps that the vehicle has time to charge.
+        self.charge_steps = charge_steps
+        # The type of rest period the vehicle has at the station.
+        self.break_type = break_type
+        # Code the break type is reported with.
+        self.break_code = BREAK_CODES[break_type]
+        # The step the vehicle started to stand in line at the station.
+        self.wait_start = None
+        # Minutes the vehicle stood in line before it last left the line.
+        self.waited = 0
+        # Number of the vehicle's place in the waiting queue of the station.
+        self.queue_seq = None
         # Wished charging power when searching for a charger.
         self.target_power = None
         # Wished end soc when charging.
@@ -57,12 +142,22 @@ class Vehicle(Agent):
         self.power = 0
         # The charger the vehicle is using. None if not charging.
         self.charger = None
-        # Current state of the vehicle.
-        self.state = dict(charging=False, waiting=False, done=False, left=False)
+        # Current state of the vehicle as a combination of the CHARGING, WAITING and LEFT flags.
+        self.state = 0
         # If the vehicle ever got to charge in the simulation.
         self.no_charge = False
 
-    def get_charge_steps(self, mean, std):
+    @property
+    def wait_time(self):
+        """
+        The amount of minutes the vehicle has stood in line at the station.
+        """
+        if self.state & WAITING:
+            return self.waited + (self.station.schedule.steps - self.wait_start) * self.resolution
+        return self.waited
+
+    @staticmethod
+    def get_charge_steps(random, resolution, mean, std):
         """
         Finds the maximum amount of steps the vehicle wants to charge from a probability distribution.
 
@@ -70,44 +165,79 @@ class Vehicle(Agent):
         -------
         Max steps available for charging.
         """
-        time = self.rand_generator.normal(loc=mean, scale=std)
-        steps = int(time / self.resolution)
+        time = random.normal(loc=mean, scale=std)
+        steps = int(time / resolution)
         return steps
 
-    def update_charge_power(self):
+    @property
+    def soc(self):
+        """
+        State of Charge of the vehicle battery in percentage. Found from the current charging segment while the
+        vehicle is charging.
+        """
+        if self.state & CHARGING:
+            return self.get_soc(self.station.schedule.steps - self.segment_start)
+        return self.soc_start
+
+    def get_soc(self, steps):
+        """
+        Finds the soc after charging for a number of steps in the current charging segment.
+        """
+        if steps >= self.segment_end - self.segment_start:
+            if self.target_reached:
+                return self.target_soc
+            steps = self.segment_end - self.segment_start
+        return round(self.soc_start + steps * self.soc_rate, 2)
+
+    def start_segment(self):
+        """
+        Starts a charging segment with the current power in this step. Finds the number of steps until the target
+        soc is reached or the time for charging runs out, and tells the station when the vehicle disconnects.
         """
-        Updates the current charging power if charger has more available power since last step in
-        case another vehicle disconnected.
-        """
-        if self.power < self.charger.accessible_power < self.target_power:
-            new_power = self.charger.accessible_power
-            self.charger.accessible_power -= (new_power - self.power)
-            self.power = new_power
-        elif self.charger.accessible_power >= self.target_power:
-            new_power = self.target_power
-            self.charger.accessible_power -= (new_power - self.power)
-            self.power = new_power
-
-    def update_soc(self):
-        """
-        Updates the soc of the vehicle when charging.
-        """
-        # Update charging power if charger has more available power since last step.
-        if self.power != self.target_power:
-            self.update_charge_power()
-        # How many kWh can be charged in the current step with the chosen power.
-        step_capacity = self.power * (self.resolution / 60)  # min/60=h
-        # Find new soc.
-        new_soc = self.soc + (step_capacity / self.capacity) * 100
-        self.charge_steps -= 1
-        if new_soc >= self.target_soc:
-            self.soc = self.target_soc
-            self.state['done'] = True
-        elif self.charge_steps == 0:
-            self.state['done'] = True
-            self.soc = round(new_soc, 2)
+        # How much the soc increases in each step with the chosen power.
+        self.soc_rate = (self.power * (self.resolution / 60) / self.capacity) * 100  # min/60=h
+        if self.soc_rate > 0:
+            target_steps = max(math.ceil((self.target_soc - self.soc_start) / self.soc_rate), 1)
         else:
-            self.soc = round(new_soc, 2)
+            target_steps = None
+        if target_steps is not None and (target_steps <= self.charge_steps or self.charge_steps < 1):
+            steps = target_steps
+            self.target_reached = True
+        else:
+            steps = max(self.charge_steps, 1)
+            self.target_reached = False
+        self.segment_start = self.station.schedule.steps
+        self.segment_end = self.segment_start + steps
+        self.station.schedule_release(self)
+
+    def end_segment(self):
+        """
+        Ends the current charging segment in this step and stores the soc and the steps that are left for charging.
+        """
+        steps = min(self.station.schedule.steps, self.segment_end) - self.segment_start
+        self.soc_start = self.get_soc(steps)
+        self.charge_steps -= steps
+
+    def update_charge_power(self):
+        """
+        Raises the charging power towards the target power with the power that is accessible on the charger and on
+        the grid connection of the station.
+        Called by the charger when another vehicle disconnected from it.
+        """
+        extra_power = min(self.target_power - self.power, self.charger.accessible_power)
+        grid = self.station.grid
+        if grid is not None:
+            extra_power = min(extra_power, grid.headroom)
+        if extra_power > 0:
+            self.charger.take_power(extra_power)
+            self.station.charger_changed(self.charger)
+            self.power += extra_power
+            if grid is not None:
+                grid.take(extra_power)
+            # Vehicles that are done charging and disconnect in this step keep their segment.
+            if self.station.schedule.steps < self.segment_end:
+                self.end_segment()
+                self.start_segment()
 
     def connect_charger(self, char_choice, pow_choice):
         """
@@ -120,63 +250,66 @@ class Vehicle(Agent):
         pow_choice: int
             The chosen power.
         """
-        if self.state['waiting']:
-            self.state['waiting'] = False
-        self.state['charging'] = True
+        if self.state & WAITING:
+            # The vehicle spent part of its break waiting since it tried to find a charger the first time.
+            wait_steps = self.station.schedule.steps - self.wait_start
+            self.waited += wait_steps * self.resolution
+            self.charge_steps -= wait_steps
+        self.state = self.state & ~WAITING | CHARGING
         self.charger = char_choice
         self.power = pow_choice
-        self.charger.add_vehicle(self.power)
-
-    def find_charger(self):
-        """
-        Finds charger that can deliver the requested power. If nothing is available the vehicle waits until next step.
-        """
-        # All charger that are available and the power they can deliver.
-        available = [(charger, charger.accessible_power) for charger in self.station.charge_list if charger.available]
-        if not available:
-            self.check_waiting()
-            return
-        # Find the charger for which the accessible power is closest to the target power of the vehicle.
-        charger = available[min(range(len(available)), key=lambda num: abs(available[num][1] - self.target_power))]
-        # If what's available is less or equal to the requested power we take all the available power:
-        if charger[1] <= self.target_power:
-            self.connect_charger(charger[0], charger[1])
-        # If the requested power is less than what's available we only take what was requested:
-        else:
-            self.connect_charger(charger[0], self.target_power)
+        self.charger.add_vehicle(self)
+        self.start_segment()
 
-    def check_vehicle(self):
+    def disconnect_charger(self):
         """
-        Checks which action to take for a vehicle.
+        Disconnects the vehicle from its charger when it is done charging and lets it leave the station. Called by
+        the station in the step the current charging segment ends.
         """
-        if self.state['left']:
-            pass
-        elif self.state['charging']:
-            pass
-        elif self.state['waiting'] or self.arrival == self.station.step_time:
-            self.find_charger()
-        else:
-            pass
+        self.end_segment()
+        self.state &= ~CHARGING
+        grid = self.station.grid
+        if grid is not None:
+            grid.free(self.power)
+        self.charger.remove_vehicle(self)
+        self.station.charger_changed(self.charger)
+        if grid is not None:
+            # Vehicles at every station that were held back by the grid connection can now charge with more power.
+            grid.share()
+        self.station.capacity_freed = True
+        self.charger = None
+        self.power = 0
+        self.leave()
 
-    def step_1(self):
+    def get_wait_steps(self):
         """
-        Removes the vehicle from its charger if it finished charging in the previous step.
+        Finds how many steps the vehicle stands in line before it leaves without charging.
+
+        Returns
+        -------
+        Number of steps, or None if the vehicle waits until a charger is available.
         """
-        if self.state['done']:
-            self.state['charging'] = False
-            self.charger.remove_vehicle(self.power)
-            self.charger = None
-            self.power = 0
-            self.state['done'] = False
-            self.state['left'] = True
+        return None
 
-    def step_2(self):
+    def stop_waiting(self):
         """
-        Finds out what action to take for the vehicle and charges if the vehicle is connected to a charger.
+        Lets the vehicle leave the line and the station without charging. Called by the station when the vehicle
+        has waited for as long as it can.
         """
-        self.check_vehicle()
-        if self.state['charging']:
-            self.update_soc()
+        # The vehicle also spent the current step waiting.
+        wait_steps = self.station.schedule.steps - self.wait_start + 1
+        self.waited += wait_steps * self.resolution
+        self.charge_steps -= wait_steps
+        self.state &= ~WAITING
+        self.no_charge = True
+        self.leave()
+
+    def leave(self):
+        """
+        Lets the vehicle leave the station.
+        """
+        self.state |= LEFT
+        self.station.vehicle_left(self)
 
 # ----------------------------------------------------------------------------------------------------------------------
 
@@ -186,19 +319,20 @@ class External(Vehicle):
     Subclass for all external vehicles.
     """
 
-    def __init__(self, unique_id, station, random, arrival, capacity, max_charge, soc, break_type):
-        super().__init__(unique_id, station, random, arrival, capacity, max_charge, soc)
+    __slots__ = ()
 
-        self.type = 'External'
-        self.break_type = break_type
+    # Label to sort vehicles by under visualization.
+    type = 'External'
+    # Code the type is reported with.
+    type_code = AGENT_CODES['External']
+
+    def reset(self, unique_id, arrival, capacity, max_charge, soc, charge_steps, break_type):
+        super().reset(unique_id, arrival, capacity, max_charge, soc, charge_steps, break_type)
 
         if self.break_type == 'ShortBreak':
             self.target_soc = 80
-            # maximum steps that the vehicle has time to charge.
-            self.charge_steps = self.get_charge_steps(mean=35, std=1)
         else:
             self.target_soc = 100
-            self.charge_steps = self.get_charge_steps(mean=660, std=6)
 
         target_power = ((0.6 * self.capacity) / (self.resolution * self.charge_steps)) * \
                        (self.target_soc - self.soc)
@@ -208,16 +342,26 @@ class External(Vehicle):
         else:
             self.target_power = target_power
 
-    def check_waiting(self):
-        if not self.state['waiting']:
-            self.state['waiting'] = True
-        self.charge_steps -= 1
-        self.wait_time += self.resolution
-        if self.break_type == 'ShortBreak' and self.wait_time >= 15 or \
-           self.break_type == 'LongBreak' and self.wait_time >= 180:
-            self.state['waiting'] = False
-            self.state['left'] = True
-            self.no_charge = True
+    @classmethod
+    def sample_charge_steps(cls, random, resolution, break_type):
+        """
+        Draws the maximum steps that an external vehicle has time to charge during its break.
+        """
+        if break_type == 'ShortBreak':
+            return cls.get_charge_steps(random, resolution, mean=35, std=1)
+        else:
+            return cls.get_charge_steps(random, resolution, mean=660, std=6)
+
+    def get_wait_steps(self):
+        """
+        External vehicles on a short break wait 15 minutes and on a long break 180 minutes.
+        """
+        if self.break_type == 'ShortBreak':
+            return math.ceil(15 / self.resolution)
+        elif self.break_type == 'LongBreak':
+            return math.ceil(180 / self.resolution)
+        else:
+            return None
 
 # ----------------------------------------------------------------------------------------------------------------------
 
@@ -227,22 +371,20 @@ class Internal(Vehicle):
     Subclass for all internal vehicles.
     """
 
-    def __init__(self, unique_id, station, random, arrival, capacity, max_charge, soc, break_type):
-        super().__init__(unique_id, station, random, arrival, capacity, max_charge, soc)
+    __slots__ = ()
 
-        self.type = 'Internal'
-        self.break_type = break_type
+    # Label to sort vehicles by under visualization.
+    type = 'Internal'
+    # Code the type is reported with.
+    type_code = AGENT_CODES['Internal']
+
+    def reset(self, unique_id, arrival, capacity, max_charge, soc, charge_steps, break_type):
+        super().reset(unique_id, arrival, capacity, max_charge, soc, charge_steps, break_type)
 
         if self.break_type == 'ShortBreak':
             self.target_soc = 80
-            # maximum steps that the vehicle has time to charge.
-            self.charge_steps = self.get_charge_steps(mean=120, std=3)
-        elif self.break_type == 'MediumBreak':
-            self.target_soc = 100
-            self.charge_steps = self.get_charge_steps(mean=270, std=3)
         else:
             self.target_soc = 100
-            self.charge_steps = self.get_charge_steps(mean=630, std=3)
 
         target_power = ((0.6 * self.capacity) / (self.resolution * self.charge_steps)) * \
                        (self.target_soc - self.soc)
@@ -252,12 +394,23 @@ class Internal(Vehicle):
         else:
             self.target_power = target_power
 
-    def check_waiting(self):
-        if not self.state['waiting']:
-            self.state['waiting'] = True
-        self.charge_steps -= 1
-        self.wait_time += self.resolution
-        if self.charge_steps == 0:
-            self.state['waiting'] = False
-            self.state['left'] = True
-            self.no_charge = True
+    @classmethod
+    def sample_charge_steps(cls, random, resolution, break_type):
+        """
+        Draws the maximum steps that an internal vehicle has time to charge during its break.
+        """
+        if break_type == 'ShortBreak':
+            return cls.get_charge_steps(random, resolution, mean=120, std=3)
+        elif break_type == 'MediumBreak':
+            return cls.get_charge_steps(random, resolution, mean=270, std=3)
+        else:
+            return cls.get_charge_steps(random, resolution, mean=630, std=3)
+
+    def get_wait_steps(self):
+        """
+        Internal vehicles wait for as long as their break lasts.
+        """
+        if self.charge_steps > 0:
+            return self.charge_steps
+        else:
+            return None
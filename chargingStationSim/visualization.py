@@ -7,14 +7,23 @@ __author__ = 'Lina Grünbeck / lina.grunbeck@gmail.com'
 
 import pandas as pd
 import math
+import os
+import hashlib
+import io
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from multiprocessing import Pool
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 # plt.style.use('stylename')
 from matplotlib import cycler
+from matplotlib import ticker
 import matplotlib.dates as matdates
 from matplotlib.dates import DayLocator, HourLocator, DateFormatter
 import matplotlib.dates as md
+from chargingStationSim.vehicle import AGENT_TYPES, BREAK_TYPES, AGENT_CODES, EVENT_CODES
 
 
 def set_plotstyle():
@@ -50,33 +59,623 @@ def set_plotstyle():
     plt.rc('lines', linewidth=2)
 
 
-def get_data(path, runs, flex):
+# Compact types of the columns in the simulation results.
+dtypes = {'RunId': 'int16', 'iteration': 'int32', 'Step': 'int32', 'time_resolution': 'int16', 'AgentID': 'Int32',
+          'Power': 'float32', 'Batt_power': 'float32', 'Soc': 'float32', 'Capacity': 'float32', 'power': 'float32',
+          'Waiting': 'Int32', 'Charged': 'boolean'}
+# Vehicle columns that are empty in the steps where only the station variables were collected. They are read as
+# nullable columns, and become plain columns of these types, or float columns if they have empty values.
+gap_dtypes = {'AgentID': 'int32', 'Waiting': 'int32', 'Charged': 'bool'}
+# Results saved with an event log are read with the full precision of the soc, which the soc of the charging vehicles
+# is found from.
+event_dtypes = {**dtypes, 'Soc': 'float64', 'Capacity': 'float64', 'power': 'float64'}
+# Vehicle columns of the results that are saved for every step, in their order in the files.
+agent_columns = ['AgentID', 'Soc', 'Arrival', 'Capacity', 'Type', 'BreakType', 'power', 'Waiting', 'Charged']
+# Agent types and break types are saved as codes, and become categoricals with the labels shared with the simulation.
+# The categories are fixed, so that the chunks and runs that are read separately can be joined without losing the type.
+categories = {'Type': pd.CategoricalDtype(AGENT_TYPES), 'BreakType': pd.CategoricalDtype(BREAK_TYPES)}
+
+
+def decode(data):
+    """
+    Turns the codes of the agent types and break types into categoricals. Results that were saved with the labels
+    themselves are turned into the same categoricals. Empty values in the vehicle columns are kept as missing values.
+
+    Parameters
+    ----------
+    data: pandas dataframe
+
+    Returns
+    -------
+    Data frame with the decoded columns.
+    """
+    for column, dtype in categories.items():
+        if column not in data:
+            continue
+        if pd.api.types.is_numeric_dtype(data[column]):
+            data[column] = pd.Categorical.from_codes(data[column].fillna(-1).astype('int8'), dtype=dtype)
+        else:
+            data[column] = data[column].astype(dtype)
+    for column, dtype in gap_dtypes.items():
+        if column in data:
+            data[column] = data[column].astype('float32' if data[column].hasnans else dtype)
+    return data
+
+
+def expand_events(data):
+    """
+    Rebuilds the vehicle rows of every step from results that were saved with an event log, so that they can be used
+    as results that were saved for every step. A vehicle shows the state after its last event before the step, or
+    after its arrival in the step. The soc of a charging vehicle is found from the soc at the start of its charging
+    segment and its charging power, and the soc and power of the battery are taken from the station variables.
+
+    Parameters
+    ----------
+    data: pandas dataframe
+        Station rows of each step and event rows of one or more iterations, with the codes as they were saved.
+
+    Returns
+    -------
+    Data frame with a row for every vehicle in every step.
+    """
+    keys = ['RunId', 'iteration']
+    arrive = EVENT_CODES['Arrive']
+    is_event = data['Event'].notna()
+    events = data.loc[is_event, keys + ['Step', 'Event'] + [column for column in agent_columns if column != 'Arrival']]
+    events = events.astype({'Step': 'int64', 'Event': 'int8', 'AgentID': 'int64'})
+    model = data.loc[~is_event, [column for column in data if column not in agent_columns + ['Event']]]
+
+    # Each vehicle with the values it arrived with, and its arrival time found from the time of the first step.
+    arrivals = events.loc[events['Event'] == arrive, keys + ['AgentID', 'Step', 'Soc', 'Capacity', 'Type',
+                                                             'BreakType']]
+    arrivals = arrivals.rename(columns={'Step': 'Arrival_step', 'Soc': 'Arrival_soc'})
+    start = model.groupby(keys)[['Time', 'time_resolution']].first().reset_index()
+    arrivals = arrivals.merge(start, on=keys)
+    arrivals['Arrival'] = (pd.to_datetime(arrivals['Time'])
+                           + pd.to_timedelta(arrivals['Arrival_step'] * arrivals['time_resolution'], unit='min')
+                           ).dt.strftime('%Y-%m-%d %H:%M:%S')
+    arrivals = arrivals.drop(columns=['Time', 'time_resolution'])
+    # Every vehicle in every step, with the station variables of the step.
+    steps = model.merge(arrivals, on=keys)
+    steps['Step'] = steps['Step'].astype('int64')
+
+    # The last event that shows in each step.
+    changes = events[keys + ['AgentID', 'Step', 'Event', 'Soc', 'power', 'Waiting', 'Charged']].rename(
+        columns={'Step': 'Event_step', 'Soc': 'Event_soc', 'power': 'Event_power', 'Waiting': 'Event_waiting',
+                 'Charged': 'Event_charged'})
+    changes['Shown'] = changes['Event_step'] + (changes['Event'] != arrive)
+    steps = pd.merge_asof(steps.sort_values('Step', kind='stable'), changes.sort_values('Shown', kind='stable'),
+                          left_on='Step', right_on='Shown', by=keys + ['AgentID'])
+    # The soc logged with an event in a step is the soc of the vehicle before the step.
+    exact = changes.loc[changes['Event'] != arrive, keys + ['AgentID', 'Event_step', 'Event_soc']]
+    exact = exact.drop_duplicates(keys + ['AgentID', 'Event_step']).rename(
+        columns={'Event_step': 'Step', 'Event_soc': 'Exact_soc'})
+    steps = steps.merge(exact, on=keys + ['AgentID', 'Step'], how='left')
+
+    step = steps['Step'].to_numpy()
+    event = steps['Event'].to_numpy(dtype=float, na_value=np.nan)
+    resolution = steps['time_resolution'].to_numpy()
+    arrived = ~np.isnan(event) & (event != arrive)
+    charging = (event == EVENT_CODES['Connect']) | (event == EVENT_CODES['Power'])
+    # Same steps as the soc of a charging vehicle in the simulation. The soc is rounded with round like in the
+    # simulation, since np.round rounds some values that end in 5 the other way.
+    rate = steps['Event_power'].to_numpy() * (resolution / 60) / steps['Capacity'].to_numpy() * 100
+    soc = np.where(arrived, steps['Event_soc'], steps['Arrival_soc'])
+    start_soc = steps['Event_soc'].to_numpy()[charging]
+    charged_steps = (step - steps['Event_step'].to_numpy())[charging]
+    soc[charging] = [round(value, 2) for value in (start_soc + charged_steps * rate[charging]).tolist()]
+    soc = np.where(steps['Exact_soc'].notna(), steps['Exact_soc'], soc)
+    power = np.where(charging, steps['Event_power'], 0.0)
+    waiting = np.where(np.isnan(event), 0,
+                       np.where(event == arrive, (step - steps['Event_step'].to_numpy()) * resolution,
+                                steps['Event_waiting'].to_numpy(dtype=float, na_value=0)))
+    charged = np.where(arrived, steps['Event_charged'].to_numpy(dtype=object, na_value=False), False).astype(bool)
+
+    battery = (steps['Type'] == AGENT_CODES['Battery']).to_numpy()
+    if battery.any():
+        soc = np.where(battery, steps['Batt_soc'], soc)
+        power = np.where(battery, steps['Batt_power'], power)
+        waiting = np.where(battery, 0, waiting)
+        charged = np.where(battery, False, charged)
+        steps.loc[battery, 'Arrival'] = np.nan
+
+    steps['Soc'] = soc
+    steps['power'] = power
+    steps['Waiting'] = waiting.astype('int64')
+    steps['Charged'] = charged
+    columns = list(model.columns) + agent_columns
+    return steps[columns].sort_values(keys + ['Step', 'AgentID'], kind='stable', ignore_index=True)
+
+
+def empty_data(columns=None):
+    """
+    Makes an empty data frame with the types the columns have after they are read, for when no runs are read.
+
+    Parameters
+    ----------
+    columns: list of str
+        Columns of the data frame. If None, the columns with known types are used.
+
+    Returns
+    -------
+    Empty data frame.
+    """
+    types = {**dtypes, **gap_dtypes, **categories}
+    if columns is None:
+        columns = list(types)
+    return pd.DataFrame({column: pd.Series(dtype=types.get(column, object)) for column in columns})
+
+
+def index_file(file, cache=None):
+    """
+    Finds where the index of a csv-file is saved, which is in the cache folder if one is given, and next to the file
+    otherwise.
+    """
+    if cache is None:
+        return file + '.index'
+    name = os.path.splitext(os.path.basename(file))[0]
+    return cache_file(cache, f'{name}_index', os.path.abspath(file))
+
+
+def build_index(file, cache=None):
+    """
+    Finds where the rows of each run and iteration are in a csv-file with simulation results. The file is scanned
+    once, and the index is saved in the cache folder or next to the file, so that the rows of any iteration can
+    later be read without scanning the rest of the file.
+
+    Parameters
+    ----------
+    file: file path
+    cache: file path
+        Folder of the cache. If None, the index is saved next to the file.
+
+    Returns
+    -------
+    Dictionary with the modification time and size of the file, its header line, and the start and end byte of each
+    block of rows for each RunId and iteration.
+    """
+    blocks = {}
+    with open(file, 'rb') as csv:
+        header = csv.readline()
+        key, start = None, len(header)
+        position = start
+        for line in csv:
+            # RunId and iteration are the first two columns.
+            comma = line.index(b',')
+            row_key = line[:line.index(b',', comma + 1)]
+            if row_key != key:
+                if key is not None:
+                    blocks.setdefault(tuple(map(int, key.split(b','))), []).append((start, position))
+                key, start = row_key, position
+            position += len(line)
+        if key is not None:
+            blocks.setdefault(tuple(map(int, key.split(b','))), []).append((start, position))
+
+    stat = os.stat(file)
+    index = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'header': header, 'blocks': blocks}
+    path = index_file(file, cache)
+    with open(path + '.tmp', 'wb') as saved:
+        pickle.dump(index, saved)
+    os.replace(path + '.tmp', path)
+    return index
+
+
+def get_index(file, cache=None):
+    """
+    Gets the index of a csv-file with simulation results, and builds it again if the file has changed since.
+
+    Parameters
+    ----------
+    file: file path
+    cache: file path
+        Folder of the cache. If None, the index is kept next to the file.
+
+    Returns
+    -------
+    Dictionary with the index, as made by build_index.
+    """
+    path = index_file(file, cache)
+    if os.path.exists(path):
+        with open(path, 'rb') as saved:
+            index = pickle.load(saved)
+        stat = os.stat(file)
+        if index['mtime'] == stat.st_mtime_ns and index['size'] == stat.st_size:
+            return index
+    return build_index(file, cache)
+
+
+def read_iteration(file, index, key, columns=None, dtype=None):
+    """
+    Reads the rows of one run and iteration from a csv-file, by seeking to where they are in the file.
+
+    Parameters
+    ----------
+    file: file path
+    index: dict
+        Index of the file, as made by build_index.
+    key: tuple
+        RunId and iteration to read.
+    columns: list of str
+        Columns to read. If None, all columns are read.
+    dtype: dict
+        Types of the columns. If None, the compact types in dtypes are used.
+
+    Returns
+    -------
+    Data frame with the rows of the iteration.
+    """
+    parts = [index['header']]
+    with open(file, 'rb') as csv:
+        for start, end in index['blocks'][key]:
+            csv.seek(start)
+            parts.append(csv.read(end - start))
+    return pd.read_csv(io.BytesIO(b''.join(parts)), usecols=columns, dtype=dtype or dtypes)
+
+
+def read_chunks(file, columns, iterations, steps, chunksize=10 ** 6, cache=None):
+    """
+    Reads the results of one run in chunks, and keeps only the chosen columns and the rows of the chosen iterations
+    and steps.
+
+    Parameters
+    ----------
+    file: file path
+    columns: list of str
+        Columns to read. If None, all columns are read.
+    iterations: list of int
+        Iterations to keep. If None, all iterations are kept.
+    steps: list of int
+        Steps to keep. If None, all steps are kept.
+    chunksize: int
+        Number of rows to read at a time.
+    cache: file path
+        Folder of the cache, to keep the index of the file in. If None, the index is kept next to the file.
+
+    Returns
+    -------
+    Generator of data frames with the chosen rows of each chunk. When iterations are chosen, each chunk is one
+    iteration that is read on its own through the index of the file. Results saved with an event log are always read
+    one iteration at a time, and the vehicle rows of every step are rebuilt from the events.
+    """
+    with open(file, 'rb') as csv:
+        events = 'Event' in csv.readline().decode().rstrip().split(',')
+    if events:
+        index = get_index(file, cache)
+        keys = [key for key in sorted(index['blocks']) if iterations is None or key[1] in iterations]
+        if keys:
+            chunks = (expand_events(read_iteration(file, index, key, dtype=event_dtypes)) for key in keys)
+        else:
+            # Only the header, for an empty frame with the chosen columns.
+            chunks = [expand_events(pd.read_csv(io.BytesIO(index['header']), dtype=event_dtypes))]
+        if columns is not None:
+            chunks = (chunk[columns] for chunk in chunks)
+        chunks = (chunk.astype({column: dtype for column, dtype in dtypes.items() if column in chunk})
+                  for chunk in chunks)
+    elif iterations is not None:
+        index = get_index(file, cache)
+        keys = [key for key in sorted(index['blocks']) if key[1] in iterations]
+        if keys:
+            chunks = (read_iteration(file, index, key, columns) for key in keys)
+        else:
+            # Only the header, for an empty frame with the chosen columns.
+            chunks = [pd.read_csv(io.BytesIO(index['header']), usecols=columns, dtype=dtypes)]
+    else:
+        chunks = pd.read_csv(file, usecols=columns, dtype=dtypes, chunksize=chunksize)
+    for chunk in chunks:
+        if steps is not None:
+            chunk = chunk[chunk['Step'].isin(steps)]
+        yield decode(chunk)
+
+
+def read_run(file, columns, iterations, steps, cache=None):
+    """
+    Reads the results of one run, with only the chosen columns and the rows of the chosen iterations and steps.
+
+    Returns
+    -------
+    Data frame with the results of the run.
+    """
+    return pd.concat(read_chunks(file, columns, iterations, steps, cache=cache), ignore_index=True)
+
+
+def cache_file(cache, name, key):
+    """
+    Finds the file in the cache folder for the given key.
+
+    Parameters
+    ----------
+    cache: file path
+        Folder of the cache.
+    name: str
+        Start of the file name, to make the cache folder easier to read.
+    key: tuple
+        Everything the cached data depends on.
+
+    Returns
+    -------
+    Path to the cache file.
+    """
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    return os.path.join(cache, f'{name}_{digest}.pkl')
+
+
+def source_key(file, columns, iterations, steps):
+    """
+    Key for the results read from a file, made from the path and the modification time and size of the file, and the
+    chosen columns, iterations and steps. The key changes when the file is written again.
+    """
+    stat = os.stat(file)
+    return (os.path.abspath(file), stat.st_mtime_ns, stat.st_size, columns, iterations, steps)
+
+
+def read_cached(file, columns, iterations, steps, cache=None):
+    """
+    Reads the results of one run as read_run does, or from the cache if the same file has been read with the same
+    choices before.
+
+    Parameters
+    ----------
+    file: file path
+    columns: list of str
+    iterations: list of int
+    steps: list of int
+    cache: file path
+        Folder of the cache. If None, the file is always read.
+
+    Returns
+    -------
+    Data frame with the results of the run.
+    """
+    if cache is None:
+        return read_run(file, columns, iterations, steps)
+    name = os.path.splitext(os.path.basename(file))[0]
+    cached = cache_file(cache, name, source_key(file, columns, iterations, steps))
+    if os.path.exists(cached):
+        return pd.read_pickle(cached)
+    data = read_run(file, columns, iterations, steps, cache)
+    # Written under a temporary name first, so that an interrupted write does not leave a broken cache file.
+    data.to_pickle(cached + '.tmp')
+    os.replace(cached + '.tmp', cached)
+    return data
+
+
+def get_data(path, runs, flex, columns=None, iterations=None, steps=None, cache=None):
     """
-    Imports and merges csv-files with chosen paths.
+    Imports and merges csv-files with chosen paths. The files of the runs are read at the same time in separate
+    threads.
 
     Parameters
     ----------
     path
     runs
     flex
+    columns: list of str
+        Columns to import besides RunId, iteration, Step and time_resolution, which the plots need to find the minute
+        of the day of each step. If None, all columns are imported.
+    iterations: list of int
+        Iterations to import. If None, all iterations are imported.
+    steps: list of int
+        Steps to import. If None, all steps are imported.
+    cache: file path
+        Folder to keep the imported results and their aggregates in, so that they are only read from the csv-files
+        again when the files change. If None, nothing is cached.
 
     Returns
     -------
     Merges dataset.
     """
-    results = []
-    if flex:
-        for run_id in runs:
-            results.append(pd.read_csv(path + f'/simulation_{run_id}_flex.csv'))
-    else:
-        for run_id in runs:
-            results.append(pd.read_csv(path + f'/simulation_{run_id}.csv'))
-    data = pd.concat(results)
-    data['Time'] = pd.to_datetime(data['Time'])
-    data['Arrival'] = pd.to_datetime(data['Arrival'])
+    if columns is not None:
+        columns = list(dict.fromkeys(['RunId', 'iteration', 'Step', 'time_resolution'] + list(columns)))
+    suffix = '_flex' if flex else ''
+    files = [path + f'/simulation_{run_id}{suffix}.csv' for run_id in runs]
+    if not files:
+        return empty_data(columns)
+    if cache is not None:
+        os.makedirs(cache, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=len(files)) as executor:
+        results = list(executor.map(partial(read_cached, columns=columns, iterations=iterations, steps=steps,
+                                            cache=cache), files))
+    data = pd.concat(results, ignore_index=True)
+    # Sources and number of rows of the data, and the cache folder, so that the aggregates can be cached as well.
+    data.attrs['sources'] = tuple(source_key(file, columns, iterations, steps) for file in files)
+    data.attrs['rows'] = len(data)
+    if cache is not None:
+        data.attrs['cache'] = cache
+    # The plots key on the minute of the day, so the time stamps of the steps are left as they are.
+    if 'Arrival' in data:
+        data['Arrival'] = pd.to_datetime(data['Arrival'])
     return data
 
 
+def time_label(minute, position=None):
+    """
+    Formats a minute of the day as a time stamp for the axis labels.
+    """
+    minute = int(minute) % (24 * 60)
+    return f'{minute // 60:02d}:{minute % 60:02d}'
+
+
+def set_time_axis(ax):
+    """
+    Labels an axis of minutes of the day with the time of day every third hour.
+    """
+    ax.xaxis.set_major_locator(ticker.MultipleLocator(180))
+    ax.xaxis.set_major_formatter(ticker.FuncFormatter(time_label))
+
+
+# Aggregates of the imported data by its sources and the aggregated columns, so that the plots only scan the data once.
+_aggregates = {}
+# Number of aggregates that are kept in memory.
+max_aggregates = 8
+# Columns to group the data by, and the name and aggregation of each aggregated column.
+aggregate_keys = ['RunId', 'iteration', 'Step', 'Type', 'BreakType']
+aggregate_columns = {'Minute': ('time_resolution', 'first'), 'power': ('power', 'sum'), 'Power': ('Power', 'first'),
+                     'Batt_power': ('Batt_power', 'first'), 'Soc': ('Soc', 'sum'), 'Soc_count': ('Soc', 'count'),
+                     'Charged': ('Charged', 'sum'), 'Waiting': ('Waiting', 'sum'),
+                     'Waiting_count': ('Waiting', 'count')}
+
+
+def aggregate(data):
+    """
+    Scans the simulation data once and sums up everything the plots need for each run, iteration, step, vehicle type
+    and break type. The aggregates of data imported with get_data are kept in memory by the files, columns,
+    iterations and steps that were read, so that station_plot, battery_plot and vehicle_plot only scan the data
+    once. If the data was imported with a cache folder, the aggregates are saved there as well. Frames made from the
+    imported data, such as a selection of its rows, keep its attributes but not its rows, so they are only cached if
+    they still have all the imported rows. The cache assumes that the values of the imported data are not changed.
+
+    Parameters
+    ----------
+    data: pandas dataframe
+
+    Returns
+    -------
+    Data frame indexed by RunId, iteration, Step, Type and BreakType, with the minute of the day of the step, the summed
+    vehicle power, the station and battery power, and sums and counts of the state of charge, the vehicles that left
+    without charging and the waiting times.
+    """
+    if data.index.names == aggregate_keys:
+        # Already aggregated, such as by aggregate_files.
+        return data
+
+    # Only the columns that were imported are aggregated.
+    columns = {name: column for name, column in aggregate_columns.items() if column[0] in data}
+    if 'sources' not in data.attrs or data.attrs.get('rows') != len(data):
+        return aggregate_chunk(data, columns)
+    key = repr((data.attrs['sources'], aggregate_keys, columns))
+    if key in _aggregates:
+        return _aggregates[key]
+
+    cached = None
+    if 'cache' in data.attrs:
+        cached = cache_file(data.attrs['cache'], 'aggregates', (data.attrs['sources'], aggregate_keys, columns))
+    if cached is not None and os.path.exists(cached):
+        aggregates = pd.read_pickle(cached)
+    else:
+        aggregates = aggregate_chunk(data, columns)
+        if cached is not None:
+            aggregates.to_pickle(cached + '.tmp')
+            os.replace(cached + '.tmp', cached)
+
+    if len(_aggregates) >= max_aggregates:
+        # The aggregates that were found first are dropped.
+        del _aggregates[next(iter(_aggregates))]
+    _aggregates[key] = aggregates
+    return aggregates
+
+
+def aggregate_chunk(data, columns):
+    """
+    Groups a part of the simulation data by run, iteration, step, vehicle type and break type.
+
+    Parameters
+    ----------
+    data: pandas dataframe
+    columns: dict
+        Name and aggregation of each aggregated column.
+
+    Returns
+    -------
+    Data frame with the aggregates of the data.
+    """
+    groups = data.groupby(aggregate_keys, dropna=False, observed=True)
+    aggregates = groups.agg(**columns)
+    # Vehicle types and break types as plain labels, so that later groupings only hold the observed combinations.
+    aggregates.index = aggregates.index.set_levels(
+        [level.astype(object) if isinstance(level, pd.CategoricalIndex) else level
+         for level in aggregates.index.levels])
+    if 'Minute' in aggregates:
+        # Minute of the day, as an integer key that is much faster to group on than time stamps.
+        aggregates['Minute'] = aggregates.index.get_level_values('Step') * aggregates['Minute'] % (24 * 60)
+    return aggregates
+
+
+def combine_aggregates(partials, columns):
+    """
+    Combines aggregates of separate parts of the simulation data. Sums and counts are added up, and the station values
+    that are the same for all vehicles in a step are taken from the first part.
+
+    Parameters
+    ----------
+    partials: list of pandas dataframe
+        Aggregates of each part, as made by aggregate_chunk.
+    columns: dict
+        Name and aggregation of each aggregated column.
+
+    Returns
+    -------
+    Data frame with the aggregates of all parts.
+    """
+    how = {name: 'first' if function == 'first' else 'sum' for name, (column, function) in columns.items()}
+    return pd.concat(partials).groupby(level=aggregate_keys, dropna=False).agg(how)
+
+
+def aggregate_run(file, columns, iterations, steps, chunksize, cache=None):
+    """
+    Aggregates the results of one run chunk by chunk, so that only one chunk of the file is in memory at a time.
+    """
+    aggregated = {name: column for name, column in aggregate_columns.items() if column[0] in columns}
+    partials = [aggregate_chunk(chunk, aggregated)
+                for chunk in read_chunks(file, columns, iterations, steps, chunksize, cache)]
+    return combine_aggregates(partials, aggregated)
+
+
+def aggregate_files(path, runs, flex, columns=None, iterations=None, steps=None, cache=None, chunksize=10 ** 6):
+    """
+    Aggregates csv-files with chosen paths without importing them, for results that do not fit in memory. Each file
+    is read and aggregated in chunks, and the partial sums and counts are combined. The aggregates hold the total
+    power of every iteration and step, so that means, standard deviations and quantiles over the iterations can be
+    found from them as well. They can be passed to the plot functions in place of the data.
+
+    Parameters
+    ----------
+    path
+    runs
+    flex
+    columns: list of str
+        Columns to aggregate besides the group keys and time_resolution. If None, all columns the plots use are
+        aggregated.
+    iterations: list of int
+        Iterations to aggregate. If None, all iterations are aggregated.
+    steps: list of int
+        Steps to aggregate. If None, all steps are aggregated.
+    cache: file path
+        Folder to keep the aggregates in, so that they are only found from the csv-files again when the files change.
+        If None, nothing is cached.
+    chunksize: int
+        Number of rows to read at a time from each file.
+
+    Returns
+    -------
+    Data frame with the aggregates, as made by aggregate.
+    """
+    if columns is None:
+        columns = [column for column, function in aggregate_columns.values()]
+    columns = list(dict.fromkeys(aggregate_keys + ['time_resolution'] + list(columns)))
+    suffix = '_flex' if flex else ''
+    files = [path + f'/simulation_{run_id}{suffix}.csv' for run_id in runs]
+    if not files:
+        aggregated = {name: column for name, column in aggregate_columns.items() if column[0] in columns}
+        return aggregate_chunk(empty_data(columns), aggregated)
+
+    cached = None
+    if cache is not None:
+        os.makedirs(cache, exist_ok=True)
+        sources = tuple(source_key(file, columns, iterations, steps) for file in files)
+        cached = cache_file(cache, 'aggregates', (sources, aggregate_keys, aggregate_columns))
+        if os.path.exists(cached):
+            return pd.read_pickle(cached)
+
+    with ThreadPoolExecutor(max_workers=len(files)) as executor:
+        results = list(executor.map(partial(aggregate_run, columns=columns, iterations=iterations, steps=steps,
+                                            chunksize=chunksize, cache=cache), files))
+    aggregates = pd.concat(results)
+    if cached is not None:
+        aggregates.to_pickle(cached + '.tmp')
+        os.replace(cached + '.tmp', cached)
+    return aggregates
+
+
 def make_subplots(share_x, share_y):
     """
     Makes figure with chosen number of subplots.
@@ -134,7 +733,285 @@ def plot_max(df, ax, col_name, number, color):
                          color=color)
 
 
-def station_plot(data, flexibility, iterations, path, runs, resolution):
+def init_renderer(params):
+    """
+    Sets up a process that renders figures, with the non-interactive Agg backend and the plot style of the main
+    process.
+
+    Parameters
+    ----------
+    params: dict
+        Matplotlib rc parameters of the main process.
+    """
+    plt.switch_backend('Agg')
+    plt.rcParams.update(params)
+
+
+def render_job(job):
+    """
+    Renders and saves one figure in a process of the pool.
+    """
+    function, args = job
+    function(*args)
+
+
+def render(jobs, number_processes=1):
+    """
+    Renders and saves figures, either one after another or in a pool of processes. Each job only carries the small
+    aggregated series of its figure, so little data is sent to the processes.
+
+    Parameters
+    ----------
+    jobs: list of tuple
+        Plot function and its arguments for each figure.
+    number_processes: int
+        Number of processes to render with. If 1, the figures are rendered in this process, and if None, one process
+        is used for each CPU.
+    """
+    if number_processes == 1:
+        for job in jobs:
+            render_job(job)
+        return
+    params = {key: value for key, value in plt.rcParams.items() if key != 'backend'}
+    with Pool(number_processes, initializer=init_renderer, initargs=(params,)) as pool:
+        for _ in pool.imap_unordered(render_job, jobs):
+            pass
+
+
+def plot_type(run_data, run_nr, path):
+    """
+    Plots the mean power of the internal and external vehicles of a run and saves the figure.
+
+    Parameters
+    ----------
+    run_data: pandas dataframe
+        Mean power of each vehicle type for each minute of the day.
+    run_nr: int
+    path: file path
+    """
+    plt.figure()
+    run_data['Interne'].plot.area(stacked=False, alpha=.8, color='#217781', label='Interne')
+    run_data['Eksterne'].plot.area(stacked=False, alpha=.9, color='#EE6666', label='Eksterne')#'#f5692c''#e88113'
+    plt.ylim(top=2000)
+    set_time_axis(plt.gca())
+    plt.xlabel('Tid')
+    plt.ylabel('Effekt [kW]')
+    plt.legend()
+    fig = plt.gcf()
+    fig.tight_layout(w_pad=0.5, h_pad=1.0)
+    fig.savefig(f'{path}/load_type_plot_{run_nr + 1}.pdf')
+    plt.close()
+
+
+def plot_rest(run_data, run_nr, path):
+    """
+    Plots the mean power of each vehicle type and break type of a run and saves the figure.
+
+    Parameters
+    ----------
+    run_data: pandas dataframe
+        Mean power of each vehicle type and break type for each minute of the day.
+    run_nr: int
+    path: file path
+    """
+    plt.figure()
+    run_data.plot()
+    plt.ylim(top=1400)
+    set_time_axis(plt.gca())
+    plt.xlabel('Tid')
+    plt.ylabel('Effekt [kW]')
+    fig = plt.gcf()
+    fig.tight_layout(w_pad=0.5, h_pad=1.0)
+    fig.savefig(f'{path}/load_rest_plot_{run_nr + 1}.pdf')
+    plt.close()
+
+
+def plot_mean(run_data, run_nr, path, flexibility):
+    """
+    Plots the mean station power of a run with its standard deviation and saves the figure.
+
+    Parameters
+    ----------
+    run_data: pandas dataframe
+        Mean and standard deviation of the station power for each minute of the day.
+    run_nr: int
+    path: file path
+    flexibility: bool
+    """
+    fig, ax = plt.subplots()
+    run_data['mean'].plot(color='#3F5D7D', ax=ax)
+    plot_max(run_data, ax, 'mean', True, '#3F5D7D')
+    over_line = (run_data['mean'] - run_data['std'])
+    under_line = (run_data['mean'] + run_data['std'])
+    plt.fill_between(run_data.index, under_line,
+                     over_line, alpha=.3, color='#3F5D7D')
+    plt.ylim(top=2600)
+    set_time_axis(ax)
+    plt.xlabel('Tid')
+    plt.ylabel('Effekt [kW]')
+    # stamps = pd.DataFrame(pd.date_range('20230101 00:00:00', periods=24, freq='1H'))
+    # plt.xticks(ticks=stamps, labels=stamps.strftime('%H'))
+    # timestamps = list(pd.date_range('20230101 00:00:00',
+    #                                     periods=24 * (60 / resolution),
+    #                                     freq='1T'))
+    # labels = list(pd.date_range('20230101 00:00:00',
+    #                                     periods=24 * (60 / resolution),
+    #                                     freq='60T')).dt.hour
+    # plt.xticks(ticks=timestamps, labels=labels)
+    # locator = mdates.HourLocator(interval=1)
+    # locator.MAXTICKS = 2277800
+    # ax.xaxis.set_major_locator(locator)
+    # ax.xaxis.set_major_formatter(mdates.DateFormatter('%H'))
+    # plt.gcf().autofmt_xdate()
+    # minlocator = matdates.MinuteLocator(byminute=[0], interval=60)
+    # minlocator = mdates.HourLocator(interval=1)
+    # minlocator = mdates.HourLocator(byhour=[0, 1])
+    # minlocator.MAXTICKS = 2277800
+    # ax.xaxis.set_major_locator(minlocator)
+    # majorFmt = matdates.DateFormatter('%H')
+    # ax.xaxis.set_major_formatter(majorFmt)
+    # plt.setp(ax.xaxis.get_majorticklabels(), rotation=90)
+
+    # xloc = md.HourLocator(interval=1)
+    # ax.xaxis.set_major_locator(xloc)
+    # ax.xaxis.set_minor_locator(HourLocator())
+    # majorFmt = md.DateFormatter('%H:%M')
+    # ax.xaxis.set_major_formatter(majorFmt)
+
+    # date_form = DateFormatter("%H")
+    # ax.xaxis.set_major_formatter(date_form)
+    # ax.xaxis.set_major_locator(mdates.HourLocator(interval=2))
+
+    if flexibility:
+        fig.tight_layout(w_pad=0.5, h_pad=1.0)
+        fig.savefig(f'{path}/mean_load_plot_{run_nr + 1}_flex.pdf')
+        # plt.show()
+        plt.close()
+    else:
+        fig.tight_layout(w_pad=0.5, h_pad=1.0)
+        fig.savefig(f'{path}/mean_load_plot_{run_nr + 1}.pdf')
+        # plt.show()
+        plt.close()
+
+
+def plot_battery_figure(power, power_flex, batt_power, batt_soc, run_nr, iteration, path):
+    """
+    Plots the station power of an iteration with and without battery flexibility, together with the power and
+    state of charge of the battery, and saves the figure.
+
+    Parameters
+    ----------
+    power: pandas series
+        Station power without a battery for each minute of the day.
+    power_flex: pandas series
+        Station power with a battery for each minute of the day.
+    batt_power: pandas series
+    batt_soc: pandas series
+    run_nr: int
+    iteration: int
+    path: file path
+    """
+    fig, (ax1, ax2, ax3) = plt.subplots(3, 1, sharex=True, gridspec_kw={'height_ratios': [2, 1, 1]})
+    fig.set_figheight(7)
+    # Plot power development with and without flexibility.
+    power.plot(ax=ax1, color='#3F5D7D', label='Uten batteri')
+    plot_max(power, ax1, None, False, '#3F5D7D')
+    power_flex.plot(ax=ax1, color='#EE6666', label='Med batteri', linestyle='dashed')
+    plot_max(power_flex, ax1, None, False, '#EE6666')
+    # Plot power development for battery.
+    batt_power.plot.area(ax=ax2, color='#07bd9c', alpha=.6, stacked=False)
+    # Plot battery SoC development.
+    batt_soc.plot(ax=ax3, color='#f5692c')
+    ax1.set(ylabel='Effekt [kW]')
+    ax1.legend()
+    ax2.set(ylabel='Effekt [kW]')
+    ax3.set(ylabel='SoC [%]')
+    ax3.set(xlabel='Tid')
+    set_time_axis(ax3)
+    fig.tight_layout(w_pad=0, h_pad=0.5)
+    fig.savefig(f'{path}/batt_plot_{run_nr + 1}_{iteration}.pdf')
+    plt.show()
+    plt.close()
+
+
+def plot_left(external, internal, run_nr, path):
+    """
+    Plots in how many iterations of a run each number of vehicles left the station without charging, and saves the
+    figure.
+
+    Parameters
+    ----------
+    external: pandas series
+        Number of iterations for each number of external vehicles that left.
+    internal: pandas series
+        Number of iterations for each number of internal vehicles that left.
+    run_nr: int
+    path: file path
+    """
+    fig = plt.figure()
+    external.plot(kind='bar', label='Eksterne', color='#d7b734')
+    internal.plot(kind='bar', label='Interne', color='#e86e13', alpha=.6)  # d46c4d
+    plt.grid(axis='x')
+    plt.xticks(rotation=0)
+    plt.ylabel('Antall iterasjoner')
+    plt.xlabel('Antall elektriske lastebiler')
+    plt.legend(loc='upper right')
+    fig.tight_layout(w_pad=0.5, h_pad=1.0)
+    fig.savefig(f'{path}/left_plot_{run_nr + 1}.pdf')
+    plt.show()
+
+
+def plot_waiting(wait, type, path):
+    """
+    Plots the mean waiting times of a vehicle type in each scenario as box plots and saves the figure.
+
+    Parameters
+    ----------
+    wait: list of pandas series
+        Mean waiting time in each iteration of each scenario.
+    type: str
+    path: file path
+    """
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    bp = ax.boxplot(wait, patch_artist=True)
+    colors = ['#2ea28e', '#d7b734']
+    for patch, color in zip(bp['boxes'], colors):
+        patch.set_facecolor(color)
+    for median in bp['medians']:
+        median.set(color='black',
+                   linewidth=1.5)
+    plt.ylabel('Tid [min]')
+    plt.xlabel('Scenario nr.')
+    fig.tight_layout(w_pad=0.5, h_pad=1.0)
+    fig.savefig(f'{path}/waiting_plot_{type}.pdf')
+    plt.show()
+
+
+def mean_load(aggregates):
+    """
+    Finds the mean and standard deviation over the iterations of the summed vehicle power in each minute of the day.
+    Steps in which only the station data was saved have no vehicle rows and are left out, instead of being counted as
+    steps without load.
+
+    Parameters
+    ----------
+    aggregates: pandas dataframe
+        Aggregates of the simulation data, as made by aggregate.
+
+    Returns
+    -------
+    Data frame indexed by RunId and Minute, with the mean and the standard deviation of the power.
+    """
+    vehicles = aggregates[aggregates.index.get_level_values('Type').notna()]
+    sum_data = vehicles.groupby(['RunId', 'iteration', 'Minute'])['power'].sum()
+    mean_data = pd.DataFrame()
+    mean_data['mean'] = sum_data.groupby(['RunId', 'Minute']).mean()
+    mean_data['std'] = sum_data.groupby(['RunId', 'Minute']).std()
+    return mean_data
+
+
+def station_plot(data, flexibility, iterations, path, runs, resolution, number_processes=1):
     """
     Plots load profiles from the simulated charging station data.
 
@@ -146,6 +1023,8 @@ def station_plot(data, flexibility, iterations, path, runs, resolution):
     path: file path
     runs: int
     resolution: int
+    number_processes: int
+        Number of processes to render the figures with.
     """
 
     # Development of the station power.
@@ -161,27 +1040,20 @@ def station_plot(data, flexibility, iterations, path, runs, resolution):
 
     # ----------------------------------------------------------------------------------------------------------------------
 
+    aggregates = aggregate(data)
+    # Figures to render once all series are aggregated.
+    jobs = []
+
     if not flexibility:
         # Development of station power by vehicle type.
-        type_data = data.groupby([data['RunId'], data['iteration'], data['Time'].dt.time, data['Type']])['power'].sum()
-        type_data_mean = type_data.groupby(['RunId', 'Time', 'Type']).mean()
+        type_data = aggregates.groupby(['RunId', 'iteration', 'Minute', 'Type'])['power'].sum()
+        type_data_mean = type_data.groupby(['RunId', 'Minute', 'Type']).mean()
         type_mean = pd.DataFrame()
         type_mean['Interne'] = type_data_mean.xs('Internal', level='Type')
         type_mean['Eksterne'] = type_data_mean.xs('External', level='Type')
 
         # Plot mean type plot for each run separately.
-        for run_nr in runs:
-            plt.figure()
-            type_mean['Interne'].xs(run_nr, level='RunId').plot.area(stacked=False, alpha=.8, color='#217781', label='Interne')
-            type_mean['Eksterne'].xs(run_nr, level='RunId').plot.area(stacked=False, alpha=.9, color='#EE6666', label='Eksterne')#'#f5692c''#e88113'
-            plt.ylim(top=2000)
-            plt.xlabel('Tid')
-            plt.ylabel('Effekt [kW]')
-            plt.legend()
-            fig = plt.gcf()
-            fig.tight_layout(w_pad=0.5, h_pad=1.0)
-            fig.savefig(f'{path}/load_type_plot_{run_nr + 1}.pdf')
-            plt.close()
+        jobs.extend((plot_type, (type_mean.xs(run_nr, level='RunId'), run_nr, path)) for run_nr in runs)
 
         # Plot all type_plots together.
         '''
@@ -202,9 +1074,8 @@ def station_plot(data, flexibility, iterations, path, runs, resolution):
 
     # ----------------------------------------------------------------------------------------------------------------------
 
-        break_data = data.groupby([data['RunId'], data['iteration'], data['Time'].dt.time, data['Type'],
-                                   data['BreakType']])['power'].sum()
-        break_data_mean = break_data.groupby(['RunId', 'Time', 'Type', 'BreakType']).mean()
+        break_data = aggregates.groupby(['RunId', 'iteration', 'Minute', 'Type', 'BreakType'])['power'].sum()
+        break_data_mean = break_data.groupby(['RunId', 'Minute', 'Type', 'BreakType']).mean()
         break_mean = pd.DataFrame()
         break_mean['I-K'] = break_data_mean.xs(('Internal', 'ShortBreak'), level=['Type', 'BreakType'])
         break_mean['I-M'] = break_data_mean.xs(('Internal', 'MediumBreak'), level=['Type', 'BreakType'])
@@ -213,16 +1084,7 @@ def station_plot(data, flexibility, iterations, path, runs, resolution):
         break_mean['E-L'] = break_data_mean.xs(('External', 'LongBreak'), level=['Type', 'BreakType'])
 
         # Plot mean type plot for each run separately.
-        for run_nr in runs:
-            plt.figure()
-            break_mean.xs(run_nr, level='RunId').plot()
-            plt.ylim(top=1400)
-            plt.xlabel('Tid')
-            plt.ylabel('Effekt [kW]')
-            fig = plt.gcf()
-            fig.tight_layout(w_pad=0.5, h_pad=1.0)
-            fig.savefig(f'{path}/load_rest_plot_{run_nr + 1}.pdf')
-            plt.close()
+        jobs.extend((plot_rest, (break_mean.xs(run_nr, level='RunId'), run_nr, path)) for run_nr in runs)
 
         # Plot all rest_plots together.
         '''
@@ -252,71 +1114,15 @@ def station_plot(data, flexibility, iterations, path, runs, resolution):
     """
 
     # Mean power and standard deviation for all runs.
-    mean_data = pd.DataFrame()
-    sum_data = data.groupby([data['RunId'], data['iteration'], data['Time'].dt.time])['power'].sum()
-    mean = sum_data.groupby(['RunId', 'Time']).mean()
-    std = sum_data.groupby(['RunId', 'Time']).std()
-    mean_data['mean'] = mean
-    mean_data['std'] = std
-    
+    mean_data = mean_load(aggregates)
+
     # Plot mean power for each run separately.
     for run_nr in runs:
         run_data = mean_data.xs(run_nr, level='RunId')
         mean_power = run_data['mean'].mean()
         print(f'Scenario:{run_nr + 1}, Mean:{mean_power}')
-        fig, ax = plt.subplots()
-        run_data['mean'].plot(color='#3F5D7D', ax=ax)
-        plot_max(run_data, ax, 'mean', True, '#3F5D7D')
-        over_line = (run_data['mean'] - run_data['std'])
-        under_line = (run_data['mean'] + run_data['std'])
-        plt.fill_between(run_data.index, under_line,
-                         over_line, alpha=.3, color='#3F5D7D')
-        plt.ylim(top=2600)
-        plt.xlabel('Tid')
-        plt.ylabel('Effekt [kW]')
-        # stamps = pd.DataFrame(pd.date_range('20230101 00:00:00', periods=24, freq='1H'))
-        # plt.xticks(ticks=stamps, labels=stamps.strftime('%H'))
-        # timestamps = list(pd.date_range('20230101 00:00:00',
-        #                                     periods=24 * (60 / resolution),
-        #                                     freq='1T'))
-        # labels = list(pd.date_range('20230101 00:00:00',
-        #                                     periods=24 * (60 / resolution),
-        #                                     freq='60T')).dt.hour
-        # plt.xticks(ticks=timestamps, labels=labels)
-        # locator = mdates.HourLocator(interval=1)
-        # locator.MAXTICKS = 2277800
-        # ax.xaxis.set_major_locator(locator)
-        # ax.xaxis.set_major_formatter(mdates.DateFormatter('%H'))
-        # plt.gcf().autofmt_xdate()
-        # minlocator = matdates.MinuteLocator(byminute=[0], interval=60)
-        # minlocator = mdates.HourLocator(interval=1)
-        # minlocator = mdates.HourLocator(byhour=[0, 1])
-        # minlocator.MAXTICKS = 2277800
-        # ax.xaxis.set_major_locator(minlocator)
-        # majorFmt = matdates.DateFormatter('%H')
-        # ax.xaxis.set_major_formatter(majorFmt)
-        # plt.setp(ax.xaxis.get_majorticklabels(), rotation=90)
-
-        # xloc = md.HourLocator(interval=1)
-        # ax.xaxis.set_major_locator(xloc)
-        # ax.xaxis.set_minor_locator(HourLocator())
-        # majorFmt = md.DateFormatter('%H:%M')
-        # ax.xaxis.set_major_formatter(majorFmt)
-
-        # date_form = DateFormatter("%H")
-        # ax.xaxis.set_major_formatter(date_form)
-        # ax.xaxis.set_major_locator(mdates.HourLocator(interval=2))
-
-        if flexibility:
-            fig.tight_layout(w_pad=0.5, h_pad=1.0)
-            fig.savefig(f'{path}/mean_load_plot_{run_nr + 1}_flex.pdf')
-            # plt.show()
-            plt.close()
-        else:
-            fig.tight_layout(w_pad=0.5, h_pad=1.0)
-            fig.savefig(f'{path}/mean_load_plot_{run_nr + 1}.pdf')
-            # plt.show()
-            plt.close()
+        jobs.append((plot_mean, (run_data, run_nr, path, flexibility)))
+    render(jobs, number_processes)
 
     # Plot mean power for all runs in one figure.
     '''
@@ -352,11 +1158,11 @@ def station_plot(data, flexibility, iterations, path, runs, resolution):
 
     # Plot median power for each run separately.
     '''
-    mean_data['median'] = sum_data.groupby(['RunId', 'Time']).median()
-    mean_data['iqr25'] = sum_data.groupby(['RunId', 'Time']).quantile(q=0.25)
-    mean_data['iqr75'] = sum_data.groupby(['RunId', 'Time']).quantile(q=0.75)
-    mean_data['min'] = sum_data.groupby(['RunId', 'Time']).min()
-    mean_data['max'] = sum_data.groupby(['RunId', 'Time']).max()
+    mean_data['median'] = sum_data.groupby(['RunId', 'Minute']).median()
+    mean_data['iqr25'] = sum_data.groupby(['RunId', 'Minute']).quantile(q=0.25)
+    mean_data['iqr75'] = sum_data.groupby(['RunId', 'Minute']).quantile(q=0.75)
+    mean_data['min'] = sum_data.groupby(['RunId', 'Minute']).min()
+    mean_data['max'] = sum_data.groupby(['RunId', 'Minute']).max()
 
     for run_nr in runs:
         run_data = mean_data.xs(run_nr, level='RunId')
@@ -381,7 +1187,7 @@ def station_plot(data, flexibility, iterations, path, runs, resolution):
     # ----------------------------------------------------------------------------------------------------------------------
 
 
-def battery_plot(data, flex_data, path, runs):
+def battery_plot(data, flex_data, path, runs, number_processes=1):
     """
     Plots load profiles from specific iterations of the simulated charging station data with and
     without battery flexibility.
@@ -392,41 +1198,31 @@ def battery_plot(data, flex_data, path, runs):
     flex_data: pandas dataframe
     path: file path
     runs: int
+    number_processes: int
+        Number of processes to render the figures with.
     """
 
-    power_data = data.groupby(['RunId', 'iteration', data['Time'].dt.time])['Power'].mean()
-    power_flex = flex_data.groupby(['RunId', 'iteration', flex_data['Time'].dt.time])['Power'].mean()
-    # power_data_mean = power_data.groupby(['Time']).mean()
-    batt_data = flex_data.groupby(['RunId', 'iteration', flex_data['Time'].dt.time])['Batt_power'].mean()
-    batt_soc = flex_data.groupby(['RunId', 'iteration', flex_data['Time'].dt.time, 'Type'])['Soc'].mean()
+    aggregates = aggregate(data)
+    flex_aggregates = aggregate(flex_data)
+    power_data = aggregates.groupby(['RunId', 'iteration', 'Minute'])['Power'].first()
+    power_flex = flex_aggregates.groupby(['RunId', 'iteration', 'Minute'])['Power'].first()
+    # power_data_mean = power_data.groupby(['Minute']).mean()
+    batt_data = flex_aggregates.groupby(['RunId', 'iteration', 'Minute'])['Batt_power'].first()
+    soc_sums = flex_aggregates.groupby(['RunId', 'iteration', 'Minute', 'Type'])[['Soc', 'Soc_count']].sum()
+    batt_soc = soc_sums['Soc'] / soc_sums['Soc_count']
+    jobs = []
     for run_nr, iters in runs.items():
         for iter in iters:
-            fig, (ax1, ax2, ax3) = plt.subplots(3, 1, sharex=True, gridspec_kw={'height_ratios': [2, 1, 1]})
-            fig.set_figheight(7)
-            # Plot power development with and without flexibility.
-            power_data.xs((run_nr, iter), level=['RunId', 'iteration']).plot(ax=ax1, color='#3F5D7D',
-                                                                             label='Uten batteri')
-            plot_max(power_data.xs((run_nr, iter), level=['RunId', 'iteration']), ax1, None, False, '#3F5D7D')
-            power_flex.xs((run_nr, iter), level=['RunId', 'iteration']).plot(ax=ax1, color='#EE6666',
-                                                                             label='Med batteri', linestyle='dashed')
-            plot_max(power_flex.xs((run_nr, iter), level=['RunId', 'iteration']), ax1, None, False, '#EE6666')
-            # Plot power development for battery.
-            batt_data.xs((run_nr, iter), level=['RunId', 'iteration']).plot.area(ax=ax2, color='#07bd9c', alpha=.6,
-                                                                                 stacked=False)
-            # Plot battery SoC development.
-            batt_soc.xs((run_nr, iter, 'Battery'), level=['RunId', 'iteration', 'Type']).plot(ax=ax3, color='#f5692c')
-            ax1.set(ylabel='Effekt [kW]')
-            ax1.legend()
-            ax2.set(ylabel='Effekt [kW]')
-            ax3.set(ylabel='SoC [%]')
-            ax3.set(xlabel='Tid')
-            fig.tight_layout(w_pad=0, h_pad=0.5)
-            fig.savefig(f'{path}/batt_plot_{run_nr + 1}_{iter}.pdf')
-            plt.show()
-            plt.close()
+            index = (run_nr, iter)
+            levels = ['RunId', 'iteration']
+            jobs.append((plot_battery_figure, (power_data.xs(index, level=levels), power_flex.xs(index, level=levels),
+                                               batt_data.xs(index, level=levels),
+                                               batt_soc.xs(index + ('Battery',), level=levels + ['Type']), run_nr,
+                                               iter, path)))
+    render(jobs, number_processes)
 
 
-def vehicle_plot(data, steps, iters, runs, path):
+def vehicle_plot(data, steps, iters, runs, path, number_processes=1):
     """
     Plots different variables and parameters for the vehicles from the simulated charging station data.
 
@@ -437,6 +1233,8 @@ def vehicle_plot(data, steps, iters, runs, path):
     iters: int
     runs: int
     path: file path
+    number_processes: int
+        Number of processes to render the figures with.
     """
     # data.set_index(['iteration', 'Step'], inplace=True)
 
@@ -539,8 +1337,12 @@ def vehicle_plot(data, steps, iters, runs, path):
     plt.show()
     """
 
+    aggregates = aggregate(data)
+    # Figures to render once all series are aggregated.
+    jobs = []
+
     # Distribution of how many external leave the station before charging.
-    charged = data.groupby(['RunId', 'iteration', 'Step', 'Type'])['Charged'].sum()
+    charged = aggregates.groupby(['RunId', 'iteration', 'Step', 'Type'])['Charged'].sum()
     charged = charged.xs(steps, level='Step')
     for run_nr in range(2):
         counts = pd.DataFrame()
@@ -549,22 +1351,13 @@ def vehicle_plot(data, steps, iters, runs, path):
         mean_external = counts['external'].mean()
         mean_internal = counts['internal'].mean()
         print(f'Scenario {run_nr}: eksterne={mean_external}, interne={mean_internal}')
-        external = counts.groupby(['external']).size()
-        internal = counts.groupby(['internal']).size()
-        fig = plt.figure()
-        external.plot(kind='bar', label='Eksterne', color='#d7b734')
-        internal.plot(kind='bar', label='Interne', color='#e86e13', alpha=.6)  # d46c4d
-        plt.grid(axis='x')
-        plt.xticks(rotation=0)
-        plt.ylabel('Antall iterasjoner')
-        plt.xlabel('Antall elektriske lastebiler')
-        plt.legend(loc='upper right')
-        fig.tight_layout(w_pad=0.5, h_pad=1.0)
-        fig.savefig(f'{path}/left_plot_{run_nr + 1}.pdf')
-        plt.show()
+        jobs.append((plot_left, (counts.groupby(['external']).size(), counts.groupby(['internal']).size(), run_nr,
+                                 path)))
+
 
     # Distribution of waiting times for all scenarios.
-    wait_mean = data.groupby(['RunId', 'iteration', 'Step', 'Type'])['Waiting'].mean()
+    wait_sums = aggregates.groupby(['RunId', 'iteration', 'Step', 'Type'])[['Waiting', 'Waiting_count']].sum()
+    wait_mean = wait_sums['Waiting'] / wait_sums['Waiting_count']
     wait_mean = wait_mean.xs(steps, level='Step')
     for type in ['Internal', 'External']:
         wait_1 = wait_mean.xs((0, type), level=['RunId', 'Type'])
@@ -572,20 +1365,8 @@ def vehicle_plot(data, steps, iters, runs, path):
         # wait_7 = wait_mean.xs((6, type), level=['RunId', 'Type'])
         # wait_8 = wait_mean.xs((7, type), level=['RunId', 'Type'])
         wait = [wait_1, wait_2]
-        fig = plt.figure()
-        ax = fig.add_subplot(111)
-        bp = ax.boxplot(wait, patch_artist=True)
-        colors = ['#2ea28e', '#d7b734']
-        for patch, color in zip(bp['boxes'], colors):
-            patch.set_facecolor(color)
-        for median in bp['medians']:
-            median.set(color='black',
-                       linewidth=1.5)
-        plt.ylabel('Tid [min]')
-        plt.xlabel('Scenario nr.')
-        fig.tight_layout(w_pad=0.5, h_pad=1.0)
-        fig.savefig(f'{path}/waiting_plot_{type}.pdf')
-        plt.show()
+        jobs.append((plot_waiting, (wait, type, path)))
+    render(jobs, number_processes)
 
 
 if __name__ == '__main__':
@@ -598,20 +1379,31 @@ if __name__ == '__main__':
     plot_station = True
     plot_vehicle = False
     plot_battery = False
+    # Number of processes to render the figures with. None uses all CPUs.
+    number_processes = 1
+    # Folder to keep the imported results and their aggregates in between runs. None turns the cache off.
+    cache_path = None
+    # If the results are aggregated chunk by chunk instead of imported, for results that do not fit in memory.
+    out_of_core = False
 
     num_steps = int((24 / time_resolution) * 60) - 1
     set_plotstyle()
-    data = get_data(save_path, runs, flexibility)
 
-    # Run functions for visualization of the simulation results.
+    # Run functions for visualization of the simulation results, each with only the data it needs.
+    load = aggregate_files if out_of_core else get_data
     if plot_station:
+        data = load(save_path, runs, flexibility, columns=['time_resolution', 'Type', 'BreakType', 'power'],
+                    cache=cache_path)
         station_plot(data, flexibility=flexibility, iterations=num_iter, path=save_path, runs=runs,
-                     resolution=time_resolution)
+                     resolution=time_resolution, number_processes=number_processes)
     if plot_vehicle and not flexibility:
-        vehicle_plot(data, steps=num_steps, iters=num_iter, runs=runs, path=save_path)
-    if plot_battery and flexibility:
-        without_flex = get_data(save_path, runs, False)
-        battery_plot(without_flex, data, save_path, batt_runs)
-    elif plot_battery and not flexibility:
-        with_flex = get_data(save_path, runs, True)
-        battery_plot(data, with_flex, save_path, batt_runs)
+        data = load(save_path, runs, flexibility, columns=['Type', 'BreakType', 'Waiting', 'Charged'],
+                    steps=[num_steps], cache=cache_path)
+        vehicle_plot(data, steps=num_steps, iters=num_iter, runs=runs, path=save_path,
+                     number_processes=number_processes)
+    if plot_battery:
+        columns = ['time_resolution', 'Type', 'BreakType', 'Power', 'Batt_power', 'Soc']
+        iterations = sorted({iteration for iters in batt_runs.values() for iteration in iters})
+        without_flex = load(save_path, runs, False, columns=columns, iterations=iterations, cache=cache_path)
+        with_flex = load(save_path, runs, True, columns=columns, iterations=iterations, cache=cache_path)
+        battery_plot(without_flex, with_flex, save_path, batt_runs, number_processes)